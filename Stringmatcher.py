@@ -2,13 +2,14 @@ import jaro
 import munkres
 import json
 import re
+import sys
 
 class StringMatcher:
     threshold = .8
     method = "jaro"
-    references = []
 
     def __init__(self, ref_path='eye_reference.txt', config_path='eye_config.txt'):
+        self.references = []
         self.build_reference(ref_path)
         self.setup_config(config_path)
 
@@ -78,12 +79,18 @@ class StringMatcher:
             return 'NONE'
         return self.references[similarities.index(max_sim)]
 
-colors = []
-sm = StringMatcher('reference-colors2.txt', 'config_eye.json')
-with open("sentences.txt") as input:
-    for line in input:
-        line = line.lower()
-        #args = re.search('([0-9]+) <(.*)> (.*)', line)
-        #match = sm.findBestMatch(args.group(3))
-        match = sm.findBestMatch(line)
-        print(line + " => " + match)
+def main():
+    "Match each line of sentences.txt against reference-colors2.txt."
+
+    sm = StringMatcher('reference-colors2.txt', 'config_eye.json')
+    with open("sentences.txt") as input:
+        for line in input:
+            line = line.lower()
+            #args = re.search('([0-9]+) <(.*)> (.*)', line)
+            #match = sm.findBestMatch(args.group(3))
+            match = sm.findBestMatch(line)
+            print(line + " => " + match)
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,31 @@
-from Levenshtein import _levenshtein
-from Levenshtein._levenshtein import *
+"""Hybrid Jaccard string matching.
 
-__doc__ = _levenshtein.__doc__    
+The functions of the python-Levenshtein extension (distance(), ratio(),
+...) are available as attributes of this package.  On Python 3.7 and later
+the extension is only imported when one of them is first used, so importing
+the package does not load it, or require it to be installed.  Older
+versions do not support a module __getattr__, so there the extension is
+imported with the package if it is installed.
+
+"""
+import sys
+
+if sys.version_info < (3, 7):
+    try:
+        from Levenshtein._levenshtein import *
+    except ImportError:
+        pass
+
+def __getattr__(name): # Python 3.7 and later
+    if name.startswith("__"):
+        raise AttributeError(name)
+    try:
+        from Levenshtein import _levenshtein
+    except ImportError:
+        raise AttributeError("%s (the Levenshtein extension is not installed)" % name)
+    try:
+        value = getattr(_levenshtein, name)
+    except AttributeError:
+        raise AttributeError("module %s has no attribute %s" % (__name__, name))
+    globals()[name] = value
+    return value
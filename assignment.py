@@ -0,0 +1,170 @@
+"""Batch solutions of the small assignment problems built by HybridJaccard.
+
+For one input, HybridJaccard builds a cost matrix (1.0 - similarity) for
+every reference phrase.  Most of these matrices are tiny and share a few
+shapes, so instead of running the Munkres algorithm on each one,
+hybrid_scores() groups them by shape, stacks each group into a NumPy array
+and evaluates every possible assignment of the group at once -- the
+exhaustive enumeration described in the munkres module documentation,
+which is cheap for small matrices when done in a single array operation.
+Shapes with too many assignments, and every shape when NumPy is not
+installed, are handed to a fallback solver.
+
+greedy_pairs() is the cheap alternative: it takes the most similar word
+pairs first, which is optimal unless two of them compete for a word.
+
+"""
+import itertools
+
+# Groups whose matrices have more possible assignments than this use the
+# fallback solver.
+MAX_ASSIGNMENTS = 5040
+
+# Assignments whose total cost is within this of the cheapest count as tied.
+TIE_TOLERANCE = 1e-9
+
+# Groups are evaluated in slices of at most this many elements (matrices x
+# assignments x pairs) at a time, which bounds the temporary arrays to a
+# few tens of megabytes however many phrases share a shape.
+MAX_SLICE_ELEMENTS = 1 << 20
+
+_numpy = None
+_assignments = {} # (rows, columns) -> array of column choices, one row per assignment
+
+def numpy_module():
+    """Import NumPy on first use; returns None if it is not installed."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+def assignment_count(rows, columns):
+    """Return the number of ways to pair each of 'rows' rows with a distinct
+    column (rows <= columns)."""
+    count = 1
+    for column in range(columns - rows + 1, columns + 1):
+        count *= column
+    return count
+
+def assignments(rows, columns):
+    """Return every assignment of rows to distinct columns (rows <= columns) as
+    an array of shape (assignments, rows)."""
+    table = _assignments.get((rows, columns))
+    if table is None:
+        table = numpy_module().array(list(itertools.permutations(range(columns), rows)),
+                                     dtype=int).reshape(-1, rows)
+        _assignments[(rows, columns)] = table
+    return table
+
+def pairs_score(cost, pairs):
+    """Return the hybrid Jaccard similarity of the (row, column) pairs chosen in
+    a cost matrix, exactly as HybridJaccard.assignment_score() computes it."""
+    values = []
+    for row, column in pairs:
+        values.append(1.0 - cost[row][column]) #go back to similarity
+    return sum(values)/(len(cost)+len(cost[0])-len(values)+values.count(0.0))
+
+def tied_scores(numpy, chosen, member_ids, choice_ids, row_order, sides):
+    """Return the hybrid Jaccard similarity of assignment choice_ids[k] of
+    matrix member_ids[k] for each k, from the chosen costs of every
+    assignment (matrices x assignments x pairs) and the row order of each
+    assignment's pairs; sides is the row count plus the column count."""
+    values = 1.0 - chosen[member_ids[:, None], choice_ids[:, None], row_order[choice_ids]]
+    # cumsum() adds the similarities one at a time, like sum() does.
+    return values.cumsum(axis=1)[:, -1] / (sides - values.shape[1] + (values == 0.0).sum(axis=1))
+
+def hybrid_scores(cost_matrices, solve):
+    """Return the hybrid Jaccard similarity of the optimal assignment in each of
+    a list of non-empty cost matrices.  solve(cost) computes the similarity
+    of a single matrix, and is used where enumeration is not possible.
+
+    Equally cheap assignments can have different hybrid Jaccard scores,
+    which count the zero-similarity pairs, so a matrix whose cheapest
+    assignments do not all give the same score is also handed to solve(),
+    to score the assignment the Munkres algorithm picks."""
+    numpy = numpy_module()
+    scores = [None] * len(cost_matrices)
+    groups = {}
+    for idx, cost in enumerate(cost_matrices):
+        groups.setdefault((len(cost), len(cost[0])), []).append(idx)
+    for (rows, columns), members in groups.items():
+        small, large = min(rows, columns), max(rows, columns)
+        if numpy is None or assignment_count(small, large) > MAX_ASSIGNMENTS:
+            for idx in members:
+                scores[idx] = solve(cost_matrices[idx])
+            continue
+        choices = assignments(small, large)
+        # For each assignment, its pairs in order of the original rows, which
+        # is the order the similarities are summed in.
+        if rows <= columns:
+            row_order = numpy.arange(small)[None, :].repeat(len(choices), axis=0)
+        else:
+            row_order = choices.argsort(axis=1)
+        slice_size = max(1, MAX_SLICE_ELEMENTS // (len(choices) * small))
+        for first in range(0, len(members), slice_size):
+            members_slice = members[first:first + slice_size]
+            stack = numpy.array([cost_matrices[idx] for idx in members_slice], dtype=float)
+            if rows > columns:
+                stack = stack.transpose(0, 2, 1) # Assign columns to rows instead.
+            chosen = stack[:, numpy.arange(small), choices]
+            totals = chosen.sum(axis=2)
+            best = totals.argmin(axis=1)
+            ambiguous = [False] * len(members_slice)
+            tied = totals <= (totals.min(axis=1) + TIE_TOLERANCE)[:, None]
+            several = tied.sum(axis=1) > 1
+            if several.any():
+                # Score the tied assignments of these matrices the way
+                # pairs_score() does: similarities summed one at a time in
+                # row order, over the pair count plus the zero count.
+                tied[~several] = False
+                member_ids, choice_ids = numpy.nonzero(tied)
+                hybrid = tied_scores(numpy, chosen, member_ids, choice_ids, row_order, rows + columns)
+                best_hybrid = tied_scores(numpy, chosen, member_ids, best[member_ids], row_order, rows + columns)
+                for member in numpy.unique(member_ids[hybrid != best_hybrid]).tolist():
+                    ambiguous[member] = True
+            for member, idx in enumerate(members_slice):
+                if ambiguous[member]:
+                    scores[idx] = solve(cost_matrices[idx])
+                    continue
+                choice = choices[best[member]].tolist()
+                if rows <= columns:
+                    pairs = [(row, choice[row]) for row in range(small)]
+                else:
+                    pairs = sorted((choice[column], column) for column in range(small))
+                scores[idx] = pairs_score(cost_matrices[idx], pairs)
+    return scores
+
+def greedy_pairs(cost):
+    """Pair rows with columns greedily: every pair with a nonzero similarity,
+    most similar first (ties in row, then column, order), is taken unless
+    its row or column is already used.  The remaining rows and columns are
+    paired up with each other; all of those pairs have similarity 0.0.
+
+    Returns the pairs in row order, and whether any nonzero pair had to be
+    skipped.  If none was, every nonzero pair was taken, so the assignment
+    is optimal.
+
+    """
+    rows, columns = len(cost), len(cost[0])
+    candidates = [(cost[row][column], row, column)
+                  for row in range(rows) for column in range(columns) if cost[row][column] < 1.0]
+    candidates.sort()
+    row_used = [False] * rows
+    column_used = [False] * columns
+    pairs = []
+    conflicted = False
+    for _, row, column in candidates:
+        if row_used[row] or column_used[column]:
+            conflicted = True
+            continue
+        row_used[row] = column_used[column] = True
+        pairs.append((row, column))
+    free_columns = [column for column in range(columns) if not column_used[column]]
+    free_rows = [row for row in range(rows) if not row_used[row]]
+    pairs.extend(zip(free_rows, free_columns))
+    pairs.sort()
+    return pairs, conflicted
@@ -0,0 +1,50 @@
+import argparse
+import sys
+import time
+import hybridJaccard as hj
+import sampleInputs
+
+def run(sm, inputs, method):
+    """Match every input with the given assignment method.  Returns the list of
+    (score, phrase index) results and the seconds spent choosing the best
+    phrases (similarity rows are computed beforehand and not timed)."""
+    sm.assignment = method
+    rows_list = [sm.similarity_rows(input_words) for input_words in inputs]
+    start = time.time()
+    results = [sm.best_phrase(rows) for rows in rows_list]
+    return results, time.time() - start
+
+def main():
+    "Command line interface: compare the assignment methods against the optimal one."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-i','--input', help="Input file of phrases (text or JSON lines).", required=True)
+    parser.add_argument('-a','--assignments', help="Comma-separated assignment methods.",
+                        default="optimal,vectorized,greedy,auto")
+    args = parser.parse_args()
+
+    sm = hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                          method_type=args.methodType)
+    inputs = sampleInputs.read_inputs(args.input)
+    print("%d inputs, %d reference phrases" % (len(inputs), len(sm.store)))
+    optimal, _ = run(sm, inputs, "optimal")
+    for method in args.assignments.split(","):
+        results, seconds = run(sm, inputs, method)
+        labels = scores = 0
+        for (max_sim, max_sim_index), (opt_sim, opt_sim_index) in zip(results, optimal):
+            if max_sim != opt_sim:
+                scores += 1
+            label = sm.store.phrase_label(max_sim_index) if sm.is_match(max_sim) else None
+            opt_label = sm.store.phrase_label(opt_sim_index) if sm.is_match(opt_sim) else None
+            if label != opt_label:
+                labels += 1
+        count = max(len(inputs), 1)
+        print("%s: %.3fs, best score differs from optimal %.4f, label differs %.4f" %
+              (method, seconds, float(scores) / count, float(labels) / count))
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
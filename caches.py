@@ -0,0 +1,168 @@
+import collections
+import threading
+
+_missing = object()
+
+class StripedCache(object):
+    """A dictionary-like cache that can be shared between threads.
+
+    Keys are spread over a fixed number of stripes, each holding its own
+    dictionary and lock, so threads working on different keys rarely
+    contend for the same lock.  Only the operations used by HybridJaccard
+    are provided.
+
+    """
+    def __init__(self, stripes=16):
+        self.stripes = [({}, threading.Lock()) for _ in range(stripes)]
+
+    def _stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def get(self, key, default=None):
+        table, lock = self._stripe(key)
+        with lock:
+            return table.get(key, default)
+
+    def __getitem__(self, key):
+        table, lock = self._stripe(key)
+        with lock:
+            return table[key]
+
+    def __setitem__(self, key, value):
+        table, lock = self._stripe(key)
+        with lock:
+            table[key] = value
+
+    def __contains__(self, key):
+        table, lock = self._stripe(key)
+        with lock:
+            return key in table
+
+    def __len__(self):
+        return sum(len(table) for table, _ in self.stripes)
+
+    def items(self):
+        result = []
+        for table, lock in self.stripes:
+            with lock:
+                result.extend(table.items())
+        return result
+
+    def clear(self):
+        for table, lock in self.stripes:
+            with lock:
+                table.clear()
+
+class LRUCache(object):
+    """A dictionary-like cache that holds at most maxsize entries, dropping the
+    least recently used entry when it is full.  It is safe to share between
+    threads.
+
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.table = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.table.pop(key, _missing)
+            if value is _missing:
+                return default
+            self.table[key] = value # Now the most recently used.
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.table.pop(key, None)
+            self.table[key] = value
+            while len(self.table) > self.maxsize:
+                self.table.popitem(last=False)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.table
+
+    def __len__(self):
+        return len(self.table)
+
+    def clear(self):
+        with self.lock:
+            self.table.clear()
+
+# Rough memory use of one PairCache entry (key, value and dictionary slot),
+# used to turn a memory budget into a number of pairs.
+PAIR_BYTES = 200
+
+class PairCache(object):
+    """Memoizes a symmetric word similarity function.
+
+    Words are interned to small integer ids, and each unordered pair of ids
+    is packed into a single integer key, so that sim(a, b) and sim(b, a)
+    share one entry.  When the cache holds max_pairs entries it is emptied
+    and starts again, which keeps its memory use bounded without the cost
+    of tracking recency on every lookup.
+
+    """
+    def __init__(self, metric, max_pairs):
+        self.metric = metric
+        self.max_pairs = max_pairs
+        self.lock = threading.Lock()
+        self.word_ids = {}
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, word1, word2):
+        word_ids = self.word_ids
+        id1 = word_ids.get(word1)
+        if id1 is None:
+            id1 = word_ids[word1] = len(word_ids)
+        id2 = word_ids.get(word2)
+        if id2 is None:
+            id2 = word_ids[word2] = len(word_ids)
+        if id1 > id2:
+            id1, id2 = id2, id1
+        return (id1 << 32) | id2
+
+    def similarity(self, word1, word2):
+        with self.lock:
+            word_ids = self.word_ids
+            key = self.key(word1, word2)
+            sim = self.table.get(key)
+            if sim is not None:
+                self.hits += 1
+                return sim
+            self.misses += 1
+        sim = self.metric(word1, word2)
+        with self.lock:
+            if self.word_ids is word_ids: # not emptied in the meantime
+                if len(self.table) >= self.max_pairs:
+                    self.clear()
+                    self.table[self.key(word1, word2)] = sim
+                else:
+                    self.table[key] = sim
+        return sim
+
+    def clear(self):
+        self.word_ids = {}
+        self.table = {}
+
+    def __len__(self):
+        return len(self.table)
+
+_pair_caches = {} # (method, threshold) -> PairCache
+_pair_caches_lock = threading.Lock()
+
+def shared_pair_cache(method, threshold, metric, max_pairs):
+    """Return the PairCache shared by all HybridJaccard objects that use the
+    given metric method and threshold, creating it if necessary.  The cache
+    grows to the largest max_pairs requested."""
+    with _pair_caches_lock:
+        pair_cache = _pair_caches.get((method, threshold))
+        if pair_cache is None:
+            pair_cache = PairCache(metric, max_pairs)
+            _pair_caches[(method, threshold)] = pair_cache
+        elif pair_cache.max_pairs < max_pairs:
+            pair_cache.max_pairs = max_pairs
+        return pair_cache
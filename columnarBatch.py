@@ -0,0 +1,99 @@
+"""Batch matching over columnar data.
+
+A column of token lists is given the way Arrow and Parquet readers lay out a
+list<string> column, without one Python list per row:
+
+    list_offsets  -- row i holds tokens list_offsets[i]:list_offsets[i + 1]
+    value_offsets -- token j is data[value_offsets[j]:value_offsets[j + 1]]
+    data          -- the UTF-8 bytes of all tokens, concatenated
+
+With pyarrow, for a ListArray 'column' of strings these are
+column.offsets.to_numpy(), column.values.offsets.to_numpy() and
+memoryview(column.values.buffers()[2]).
+
+"""
+from array import array
+import argparse
+import sys
+import time
+import hybridJaccard as hj
+import sampleInputs
+
+def match_token_column(sm, list_offsets, value_offsets, data, encoding="utf-8"):
+    """Match every row of a token list column with the HybridJaccard object sm.
+
+    Rows are grouped by their bytes and token boundaries, so each distinct
+    token list is decoded and matched only once.  Returns an array of label
+    ids aligned with the rows (-1 where there is no match); sm.label_string()
+    or label_dictionary() turns them into labels.
+
+    """
+    data = memoryview(data)
+    rows = len(list_offsets) - 1
+    distinct = {} # (bytes, token boundaries) -> index into first_rows
+    first_rows = [] # a row holding each distinct token list
+    row_slots = array('i', [0]) * rows
+    for row in range(rows):
+        first, last = list_offsets[row], list_offsets[row + 1]
+        start = value_offsets[first]
+        key = (data[start:value_offsets[last]].tobytes(),
+               tuple(value_offsets[token] - start for token in range(first + 1, last)))
+        slot = distinct.get(key)
+        if slot is None:
+            slot = distinct[key] = len(first_rows)
+            first_rows.append(row)
+        row_slots[row] = slot
+    distinct = None
+    word_lists = []
+    for row in first_rows:
+        word_lists.append([data[value_offsets[token]:value_offsets[token + 1]].tobytes().decode(encoding)
+                           for token in range(list_offsets[row], list_offsets[row + 1])])
+    slot_labels = sm.findBestLabelIds(word_lists)
+    return array('i', (slot_labels[slot] for slot in row_slots))
+
+def label_dictionary(sm):
+    """Return the label table of sm as a list of strings, indexed by label id,
+    for use as the dictionary of a dictionary-encoded label column."""
+    return [sm.label_string(label_id) for label_id in range(len(sm.store.label_offsets) - 1)]
+
+def token_column(word_lists, encoding="utf-8"):
+    """Build the (list_offsets, value_offsets, data) buffers of a column from
+    word lists."""
+    list_offsets = array('i', [0])
+    value_offsets = array('i', [0])
+    data = bytearray()
+    for words in word_lists:
+        for word in words:
+            data.extend(word.encode(encoding))
+            value_offsets.append(len(data))
+        list_offsets.append(len(value_offsets) - 1)
+    return list_offsets, value_offsets, bytes(data)
+
+def main():
+    "Command line interface: match a sample file as a column and report timing."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-i','--input', help="Input file of phrases (text or JSON lines).", required=True)
+    args = parser.parse_args()
+
+    sm = hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                          method_type=args.methodType)
+    list_offsets, value_offsets, data = token_column(sampleInputs.read_inputs(args.input))
+    start = time.time()
+    label_ids = match_token_column(sm, list_offsets, value_offsets, data)
+    elapsed = time.time() - start
+    dictionary = label_dictionary(sm)
+    counts = {}
+    for label_id in label_ids:
+        label = dictionary[label_id] if label_id >= 0 else "(NONE)"
+        counts[label] = counts.get(label, 0) + 1
+    for label, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print("%6d %s" % (count, label))
+    print("%d rows matched in %.3fs" % (len(label_ids), elapsed))
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
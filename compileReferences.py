@@ -0,0 +1,36 @@
+import argparse
+import sys
+import hybridJaccard as hj
+
+def main():
+    """Command line interface: compile reference data, report repeated and
+    conflicting phrases, and write a memory-mappable store and/or a minimal
+    reference file."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-o','--output', help="Reference store file to write.", required=False)
+    parser.add_argument('-e','--referencesOutput', help="Deduplicated reference file to write.", required=False)
+    args = parser.parse_args()
+
+    sm = hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                          method_type=args.methodType)
+    for phrase, kept, dropped in sm.reference_conflicts:
+        sys.stderr.write("conflict: '%s' => '%s' (kept), '%s' (dropped)\n" %
+                         (" ".join(phrase), " ".join(kept), " ".join(dropped)))
+    print("%d phrases, %d words, %d repeated phrases dropped, %d conflicts" %
+          (len(sm.store), len(sm.store.words), sm.store.duplicates, len(sm.reference_conflicts)))
+    if args.output:
+        sm.save_reference_store(args.output)
+        print("reference store => %s" % args.output)
+    if args.referencesOutput:
+        with open(args.referencesOutput, 'w') as out:
+            for line in sm.store.reference_lines():
+                out.write(line + "\n")
+        print("references => %s" % args.referencesOutput)
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import argparse
+import sys
+import time
+import hybridJaccard as hj
+import phoneticIndex
+import sampleInputs
+
+def evaluate(sm, inputs, shortlist):
+    """Compare a candidate shortlist function against the exact scan.
+
+    shortlist(input_words) returns the increasing indexes of the phrases to
+    score.  Returns (recall, agreement, mean shortlist size, exact seconds,
+    shortlist seconds), where recall is the fraction of inputs with an exact
+    match whose best phrase is in the shortlist, and agreement the fraction
+    of all inputs for which scoring only the shortlist gives the same label.
+
+    """
+    matched = found = agreed = listed = 0
+    exact_time = short_time = 0.0
+    for input_words in inputs:
+        rows = sm.similarity_rows(input_words)
+        start = time.time()
+        max_sim, max_sim_index = sm.best_phrase(rows)
+        exact_time += time.time() - start
+        start = time.time()
+        candidates = shortlist(input_words)
+        short_sim, short_sim_index = sm.best_phrase(rows, candidates)
+        short_time += time.time() - start
+        listed += len(candidates)
+        exact_label = sm.store.phrase_label(max_sim_index) if sm.is_match(max_sim) else None
+        short_label = sm.store.phrase_label(short_sim_index) if sm.is_match(short_sim) else None
+        if exact_label is not None:
+            matched += 1
+            if max_sim_index in candidates:
+                found += 1
+        if exact_label == short_label:
+            agreed += 1
+    count = max(len(inputs), 1)
+    return (float(found) / max(matched, 1), float(agreed) / count,
+            float(listed) / count, exact_time, short_time)
+
+def main():
+    "Command line interface: measure recall of the approximate mode and phonetic blocking against the exact scan."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-i','--input', help="Input file of phrases (text or JSON lines).", required=True)
+    parser.add_argument('-k','--shortlistSizes', help="Comma-separated shortlist sizes.", default="5,10,20,50")
+    parser.add_argument('-n','--ngramSize', help="Character n-gram size.", type=int, default=3)
+    parser.add_argument('-b','--blocking', help="Comma-separated phonetic key methods to evaluate (soundex, metaphone).", required=False)
+    args = parser.parse_args()
+
+    sm = hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                          method_type=args.methodType)
+    sm.ngram_size = args.ngramSize
+    inputs = sampleInputs.read_inputs(args.input)
+    print("%d inputs, %d reference phrases" % (len(inputs), len(sm.store)))
+    for k in [int(k) for k in args.shortlistSizes.split(",") if k]:
+        index = sm.get_ngram_index()
+        recall, agreement, listed, exact_time, short_time = evaluate(
+            sm, inputs, lambda input_words: index.query(input_words, k))
+        print("k=%d: recall@k %.4f, same label %.4f, %.1f phrases scored, %.3fs exact, %.3fs approximate" %
+              (k, recall, agreement, listed, exact_time, short_time))
+    if args.blocking:
+        sm.blocking = phoneticIndex.parse_methods(args.blocking)
+        index = sm.get_phonetic_index()
+        recall, agreement, listed, exact_time, short_time = evaluate(sm, inputs, index.query)
+        print("blocking %s: recall %.4f, same label %.4f, %.1f phrases scored, %.3fs exact, %.3fs blocked" %
+              (",".join(sm.blocking), recall, agreement, listed, exact_time, short_time))
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+from array import array
+from bisect import bisect_left
+
+def words_hash(sorted_word_ids):
+    """Hash a sorted list of word ids to 32 bits, the same way on every Python
+    version, since the hashes are saved in compiled reference stores."""
+    value = len(sorted_word_ids)
+    for word_id in sorted_word_ids:
+        value = ((value * 1000003) ^ word_id) & 0xFFFFFFFF
+    return value
+
+class ExactIndex(object):
+    """Finds the reference phrases that occur verbatim in an input.
+
+    The phrases' word ids are compiled into an Aho-Corasick automaton over
+    tokens, so all occurrences in an input are found in a single pass over
+    its words, however many phrases there are.  A second table maps the
+    sorted word ids of each phrase to the first phrase with those words, for
+    inputs that are a reordering of a whole phrase.
+
+    Everything is kept in flat integer arrays, which ReferenceStore.save()
+    writes into the store file, so that the processes mapping a compiled
+    store share the index instead of each building its own:
+
+    root          word id -> state reached from the start state, or 0
+    edge_offsets  state -> start of its transitions in edge_words and
+                  edge_targets, which are sorted by word id (the start
+                  state's are in root instead)
+    phrase_at     state -> phrase spelled by the path to it, or -1
+    fail          state -> longest proper suffix state
+    output        state -> nearest state on the fail chain that spells a
+                  phrase, or 0
+    reorder       open addressing hash table of phrase indexes (-1 for a
+                  free slot), keyed by words_hash() of the sorted word ids
+
+    """
+    def __init__(self, store, root, edge_offsets, edge_words, edge_targets, phrase_at, fail, output, reorder):
+        self.store = store
+        self.size = len(store)
+        self.root = root
+        self.edge_offsets = edge_offsets
+        self.edge_words = edge_words
+        self.edge_targets = edge_targets
+        self.phrase_at = phrase_at
+        self.fail = fail
+        self.output = output
+        self.reorder = reorder
+
+    @classmethod
+    def build(cls, store):
+        # The automaton is built with a dict of transitions per state, then
+        # flattened.
+        transitions = [{}]
+        phrase_at = array('i', [-1])
+        reorder = array('i', [-1]) * max(1, 1 << (2 * len(store) - 1).bit_length())
+        mask = len(reorder) - 1
+        for idx in range(len(store)):
+            word_ids = store.phrase_word_ids(idx)
+            key = sorted(word_ids)
+            slot = words_hash(key) & mask
+            while reorder[slot] >= 0 and sorted(store.phrase_word_ids(reorder[slot])) != key:
+                slot = (slot + 1) & mask
+            if reorder[slot] < 0: # keep the first phrase with these words
+                reorder[slot] = idx
+            state = 0
+            for word_id in word_ids:
+                next_state = transitions[state].get(word_id)
+                if next_state is None:
+                    next_state = len(transitions)
+                    transitions[state][word_id] = next_state
+                    transitions.append({})
+                    phrase_at.append(-1)
+                state = next_state
+            if phrase_at[state] < 0: # phrases are unique, but keep the first
+                phrase_at[state] = idx
+        fail = array('i', [0]) * len(transitions)
+        output = array('i', [0]) * len(transitions)
+        # Breadth-first, so that every fail state is complete before it is used.
+        queue = list(transitions[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for word_id, next_state in transitions[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and word_id not in transitions[fallback]:
+                    fallback = fail[fallback]
+                target = transitions[fallback].get(word_id, 0)
+                fail[next_state] = target
+                output[next_state] = target if phrase_at[target] >= 0 else output[target]
+        root = array('i', [0]) * len(store.words)
+        for word_id, next_state in transitions[0].items():
+            root[word_id] = next_state
+        edge_offsets = array('i', [0, 0])
+        edge_words = array('i')
+        edge_targets = array('i')
+        for state in range(1, len(transitions)):
+            for word_id, next_state in sorted(transitions[state].items()):
+                edge_words.append(word_id)
+                edge_targets.append(next_state)
+            edge_offsets.append(len(edge_words))
+        return cls(store, root, edge_offsets, edge_words, edge_targets, phrase_at, fail, output, reorder)
+
+    @classmethod
+    def from_store(cls, store):
+        """Use the index saved in a mapped store if there is one."""
+        exact_fail = getattr(store, "exact_fail", None)
+        if exact_fail is None:
+            return cls.build(store)
+        return cls(store, store.exact_root, store.exact_offsets, store.exact_words, store.exact_targets,
+                   store.exact_phrases, exact_fail, store.exact_output, store.exact_reorder)
+
+    def sections(self):
+        """Return the arrays to save in a store file, as (name, array) pairs."""
+        return [("exact_root", self.root),
+                ("exact_offsets", self.edge_offsets),
+                ("exact_words", self.edge_words),
+                ("exact_targets", self.edge_targets),
+                ("exact_phrases", self.phrase_at),
+                ("exact_fail", self.fail),
+                ("exact_output", self.output),
+                ("exact_reorder", self.reorder)]
+
+    def step(self, state, word_id):
+        """Return the state reached from 'state' by a word, or 0 if it has no
+        transition for it."""
+        if state == 0:
+            return self.root[word_id] if word_id < len(self.root) else 0
+        start, end = self.edge_offsets[state], self.edge_offsets[state + 1]
+        pos = bisect_left(self.edge_words, word_id, start, end)
+        if pos < end and self.edge_words[pos] == word_id:
+            return self.edge_targets[pos]
+        return 0
+
+    def occurrences(self, word_ids):
+        """Return the indexes of the phrases that occur as consecutive words of
+        the input, given by its word ids (None for a word that is not in the
+        reference vocabulary)."""
+        found = []
+        phrase_at = self.phrase_at
+        fail = self.fail
+        output = self.output
+        state = 0
+        for word_id in word_ids:
+            if word_id is None:
+                state = 0
+                continue
+            next_state = self.step(state, word_id)
+            while next_state == 0 and state:
+                state = fail[state]
+                next_state = self.step(state, word_id)
+            state = next_state
+            match = state if phrase_at[state] >= 0 else output[state]
+            while match:
+                found.append(int(phrase_at[match]))
+                match = output[match]
+        return found
+
+    def reordering(self, word_ids):
+        """Return the index of the first phrase made of exactly the input's words,
+        in any order, or -1."""
+        if None in word_ids:
+            return -1
+        key = sorted(word_ids)
+        reorder = self.reorder
+        mask = len(reorder) - 1
+        slot = words_hash(key) & mask
+        while reorder[slot] >= 0:
+            idx = int(reorder[slot])
+            if self.store.phrase_length(idx) == len(key) and sorted(self.store.phrase_word_ids(idx)) == key:
+                return idx
+            slot = (slot + 1) & mask
+        return -1
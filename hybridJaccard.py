@@ -1,23 +1,106 @@
 import jaro
+import levenshtein_sim
 import munkres
+from array import array
+import itertools
 import json
+import re
+import threading
+import assignment
+import caches
+import exactIndex
+import ngramIndex
+import phoneticIndex
+import referenceStore
+import vocabularyIndex
+
+SNAPSHOT_FORMAT = "hybrid_jaccard_snapshot"
+SNAPSHOT_VERSION = 2
+CACHE_FORMAT = "hybrid_jaccard_cache"
+CACHE_VERSION = 3
+ASSIGNMENT_METHODS = ("optimal", "vectorized", "greedy", "auto")
+# The "vectorized" assignment solves the cost matrices of at most this many
+# phrases at a time.
+VECTORIZED_BATCH = 4096
+
+def pickle_module():
+    """Import pickle when a snapshot is first saved or loaded, rather than with
+    this module."""
+    try:
+        import cPickle as pickle
+    except ImportError: # Python 3
+        import pickle
+    return pickle
 
 class HybridJaccard(object):
     def __init__(self, ref_path=None, config_path=None,
                  threshold = 0.8,
                  method_type="method_type",
-                 method = "jaro"):
+                 method = "jaro",
+                 thread_safe=False,
+                 store_path=None):
         self.threshold = threshold
         self.method_type = method_type
+        # Memory budget for the word-pair similarity cache shared with other
+        # instances using the same metric and threshold; 0 disables it.
+        self.pair_cache_mb = 0
+        self.pair_cache = None
         self.set_sim_metric(method)
-        self.reference_phrases = []
-        self.labels = []
-        self.cache = {}
+        # How the pairing of input and reference words is found: "optimal"
+        # (Munkres, one phrase at a time), "vectorized" (all phrases of a
+        # query at once, see the assignment module), "greedy" (most similar
+        # pairs first; may be suboptimal) or "auto" (greedy, switching to
+        # Munkres when greedy choices compete for a word).
+        self.assignment = "optimal"
+        # The lowest hybrid Jaccard score accepted as a match.  Phrases and
+        # inputs that cannot reach it are not scored (see best_phrase()).
+        self.min_score = 1e-20
+        self.use_vocabulary_index = True
+        self.vocabulary_index = None # built when first needed
+        # Reference phrases found verbatim in an input give a score the scan
+        # has to beat (see exact_seed()).
+        self.use_exact_index = True
+        self.exact_index = None # built when first needed
+        # Similarity rows of recently seen input words, reused by later calls
+        # that share those words.  row_cache_key records the settings the
+        # rows were computed with.
+        self.row_cache = caches.LRUCache(1024)
+        self.row_cache_key = None
+        # Approximate mode: when approximate_k is set, only the approximate_k
+        # phrases closest in character n-grams are scored exactly.
+        self.approximate_k = 0
+        self.ngram_size = 3
+        self.ngram_index = None # built when first needed
+        # Phonetic blocking: when blocking names key methods, only phrases
+        # with a word that sounds like an input word are scored.
+        self.blocking = ()
+        self.phonetic_index = None # built when first needed
+        if store_path is not None:
+            # A compiled, read-only reference store shared through mmap.
+            self.store = referenceStore.MappedReferenceStore(store_path)
+        else:
+            self.store = referenceStore.ReferenceStore()
+        # In thread-safe mode the instance may be shared by a pool of
+        # threads once the references have been loaded: the result cache is
+        # guarded by striped locks, and each call to sim_measure() solves its
+        # assignment problem with its own Munkres object.
+        self.thread_safe = thread_safe
+        # The result cache maps the tuple of an input's token ids (see
+        # cache_key()) to the id of its best label, or -1.  Words get token
+        # ids only when an input containing them is stored, so the token
+        # table grows with the cache (neither is ever pruned).
+        self.token_ids = {} # input word -> token id
+        self.token_lock = threading.Lock()
+        if thread_safe:
+            self.cache = caches.StripedCache()
+        else:
+            self.cache = {}
         self.m = munkres.Munkres() # Create a Munkres object, which can be used multiple times.
         if ref_path is not None:
             self.read_reference_file(ref_path)
         if config_path is not None:
             self.read_config_file(config_path)
+        self.store.freeze()
 
     def read_reference_file(self, ref_path):
         """Read the reference file, building the lists of reference words and the resulting labels."""
@@ -28,24 +111,165 @@ class HybridJaccard(object):
     def build_references(self, ref_line):
         main_phrase, _, equivalents = ref_line.partition(":")
         equivalent_phrases = [s.strip() for s in equivalents.split(',')]
-        main_phrase = main_phrase.strip()
-        if not main_phrase in self.labels:
-            # Record only unique instances.
-            #
-            # TODO: It should be an error for a main phrase to match a
-            # previously declared equivalent phrase.
-            main_phrase_words = main_phrase.split()
-            self.reference_phrases.append(main_phrase_words)
-            self.labels.append(main_phrase_words)
+        main_phrase_words = main_phrase.split()
+        # Repeated phrases are dropped by the store.  A phrase that is repeated
+        # with a different label keeps its first label; the clash is listed in
+        # reference_conflicts.
+        self.store.add_phrase(main_phrase_words, main_phrase_words)
         for equivalent_phrase in equivalent_phrases:
-            if equivalent_phrase and not equivalent_phrase in self.labels:
-                # Skip empty phrases. If an equivalent phrase occurs multiple times,
-                # keep the first mapping and ignore the rest.
-                #
-                # TODO: It should be an error for an equivalent phrase to occur
-                # multiple times or to match a main phrase.
-                self.reference_phrases.append(equivalent_phrase.split())
-                self.labels.append(main_phrase.split())
+            if equivalent_phrase:
+                # Skip empty phrases. Aliases share the main phrase's label.
+                self.store.add_phrase(equivalent_phrase.split(), main_phrase_words)
+
+    @property
+    def reference_conflicts(self):
+        """Phrases declared with more than one label, as a list of (phrase, kept
+        label, dropped label) tuples of word lists."""
+        return self.store.conflicts
+
+    def save_reference_store(self, store_path):
+        """Save the compiled references to a file that can be passed as store_path
+        when creating other HybridJaccard instances."""
+        self.store.save(store_path)
+
+    def __getstate__(self):
+        """Pickle support. The similarity metric and the Munkres object are
+        recreated on loading, and the row cache is not saved.  The result
+        cache is saved as (input words, label id) pairs."""
+        state = self.__dict__.copy()
+        del state["sim_metric"]
+        del state["m"]
+        del state["token_ids"]
+        del state["token_lock"]
+        state["pair_cache"] = None # shared; found again by set_sim_metric()
+        state["cache"] = self.cache_entries()
+        state["row_cache"] = self.row_cache.maxsize
+        state["row_cache_key"] = None
+        state["exact_index"] = None # quick to rebuild
+        if isinstance(self.store, referenceStore.MappedReferenceStore):
+            # The index is a view of the mapped file; it is rebuilt from it.
+            state["vocabulary_index"] = None
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        cache = state.pop("cache")
+        row_cache_size = state.pop("row_cache")
+        self.__dict__.update(state)
+        self.set_sim_metric(self.method)
+        self.m = munkres.Munkres()
+        self.row_cache = caches.LRUCache(row_cache_size)
+        self.token_ids = {}
+        self.token_lock = threading.Lock()
+        if self.thread_safe:
+            self.cache = caches.StripedCache()
+        else:
+            self.cache = {}
+        for input_words, label_id in cache:
+            self.cache[self.cache_key(input_words)] = label_id
+
+    def save_snapshot(self, snapshot_path, include_cache=False):
+        """Save the fully built instance (references, labels, configuration,
+        metric and indexes, and optionally the result cache) to a file that
+        load_snapshot() can read without parsing any reference data."""
+        self.get_vocabulary_index()
+        if self.approximate_k:
+            self.get_ngram_index()
+        if self.blocking:
+            self.get_phonetic_index()
+        state = self.__getstate__()
+        if not include_cache:
+            state["cache"] = []
+        pickle = pickle_module()
+        with open(snapshot_path, "wb") as snapshot_file:
+            pickle.dump({"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, "state": state},
+                        snapshot_file, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load_snapshot(cls, snapshot_path):
+        """Create an instance from a file written by save_snapshot()."""
+        with open(snapshot_path, "rb") as snapshot_file:
+            snapshot = pickle_module().load(snapshot_file)
+        if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError("%s is not a HybridJaccard snapshot" % snapshot_path)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("%s has snapshot version %s, expected %d" %
+                             (snapshot_path, snapshot.get("version"), SNAPSHOT_VERSION))
+        sm = cls.__new__(cls)
+        sm.__setstate__(snapshot["state"])
+        return sm
+
+    def fingerprint(self):
+        """Return a digest of everything that determines match results: the
+        metric, its settings and the reference phrases and labels."""
+        import hashlib
+        # The exact assignment methods give the same results, so caches can be
+        # shared between them, but not with the greedy one.
+        settings = [self.method, repr(self.threshold), repr(self.min_score),
+                    self.approximate_k, self.ngram_size, list(self.blocking),
+                    self.assignment == "greedy"]
+        digest = hashlib.sha1(json.dumps(settings).encode("utf-8"))
+        for line in self.store.reference_lines():
+            digest.update(b"\n")
+            digest.update(line.encode("utf-8") if not isinstance(line, bytes) else line)
+        return digest.hexdigest()
+
+    def cache_entries(self):
+        """Return the contents of the result cache as a list of (input words,
+        label id) pairs."""
+        entries = list(self.cache.items())
+        # Every token id of these keys was given out before the key was
+        # stored, so the table copied afterwards covers them; the lock keeps
+        # other threads from adding words while it is copied.
+        with self.token_lock:
+            token_items = list(self.token_ids.items())
+        words = [None] * len(token_items)
+        for word, token_id in token_items:
+            words[token_id] = word
+        return [([words[token_id] for token_id in key], label_id) for key, label_id in entries]
+
+    def save_cache(self, cache_path):
+        """Write the result cache to a JSON file that load_cache() can read.
+        Each entry holds the input words and the label words, or null for no
+        match."""
+        entries = [[input_words, self.store.label(label_id) if label_id >= 0 else None]
+                   for input_words, label_id in self.cache_entries()]
+        with open(cache_path, "w") as cache_file:
+            json.dump({"format": CACHE_FORMAT, "version": CACHE_VERSION,
+                       "fingerprint": self.fingerprint(),
+                       "entries": sorted(entries)}, cache_file)
+
+    def load_cache(self, cache_path):
+        """Add the results in a file written by save_cache() to the result
+        cache. The file must have been written by an instance with the same
+        references and settings."""
+        with open(cache_path, "r") as cache_file:
+            data = json.load(cache_file)
+        if data.get("format") != CACHE_FORMAT or data.get("version") != CACHE_VERSION:
+            raise ValueError("%s is not a version %d HybridJaccard cache file" % (cache_path, CACHE_VERSION))
+        if data.get("fingerprint") != self.fingerprint():
+            raise ValueError("%s was built with different references or settings" % cache_path)
+        store = self.store
+        label_ids = dict((tuple(store.label(label_id)), label_id)
+                         for label_id in range(len(store.label_offsets) - 1))
+        for input_words, label in data["entries"]:
+            if label is None:
+                label_id = -1
+            else:
+                label_id = label_ids.get(tuple(label))
+                if label_id is None:
+                    raise ValueError("%s has an unknown label %s" % (cache_path, " ".join(label)))
+            self.cache[self.cache_key(input_words)] = label_id
+
+    @property
+    def reference_phrases(self):
+        """The reference phrases, as a list of lists of words."""
+        return [self.store.phrase(idx) for idx in range(len(self.store))]
+
+    @property
+    def labels(self):
+        """The label of each reference phrase, as a list of lists of words."""
+        return [self.store.phrase_label(idx) for idx in range(len(self.store))]
 
     def read_config_file(self, config_path):
         """Read the configuration file, extracting the method name and threshold."""
@@ -60,9 +284,41 @@ class HybridJaccard(object):
                 threshold_string = parameters.get("threshold")
                 if threshold_string:
                     self.threshold = float(threshold_string)
-            method = method_data.get("partial_method")
-            if method:
-                self.set_sim_metric(method)
+                assignment_string = parameters.get("assignment")
+                if assignment_string:
+                    if assignment_string not in ASSIGNMENT_METHODS:
+                        raise ValueError("unknown assignment method %s" % assignment_string)
+                    self.assignment = assignment_string
+                min_score_string = parameters.get("min_score")
+                if min_score_string:
+                    min_score = float(min_score_string)
+                    if not min_score > 0.0:
+                        raise ValueError("min_score must be above 0, got %s" % min_score_string)
+                    self.min_score = min_score
+                index_string = parameters.get("vocabulary_index")
+                if index_string:
+                    self.use_vocabulary_index = index_string.lower() == "true"
+                exact_string = parameters.get("exact_index")
+                if exact_string:
+                    self.use_exact_index = exact_string.lower() == "true"
+                approximate_string = parameters.get("approximate")
+                if approximate_string:
+                    self.approximate_k = int(approximate_string)
+                blocking_string = parameters.get("blocking")
+                if blocking_string:
+                    self.blocking = phoneticIndex.parse_methods(blocking_string)
+                ngram_string = parameters.get("ngram_size")
+                if ngram_string:
+                    self.ngram_size = int(ngram_string)
+                row_cache_string = parameters.get("row_cache_size")
+                if row_cache_string:
+                    self.row_cache = caches.LRUCache(int(row_cache_string))
+                pair_cache_string = parameters.get("pair_cache_mb")
+                if pair_cache_string:
+                    self.pair_cache_mb = float(pair_cache_string)
+            # Set the metric even if it has not changed: the pair cache
+            # depends on the threshold.
+            self.set_sim_metric(method_data.get("partial_method") or self.method)
         references = method_data.get("references")
         if references:
             for ref_line in references:
@@ -71,32 +327,40 @@ class HybridJaccard(object):
         if referencesFiles:
             for ref_file in referencesFiles:
                 self.read_reference_file(ref_file)
+        cache_file = method_data.get("cache_file")
+        if cache_file:
+            # Pre-computed results, written by warmCache.py.
+            self.load_cache(cache_file)
 
     def jaro_winkler_sim(self, seq1, seq2):
-        return jaro.metric_jaro_winkler(seq1, seq2)
+        return jaro.jaro_winkler(seq1, seq2)
 
     def levenshtein_sim(self, seq1, seq2):
-        oneago = None
-        thisrow = range(1, len(seq2) + 1) + [0]
-        for x in xrange(len(seq1)):
-            twoago, oneago, thisrow = oneago, thisrow, [0] * len(seq2) + [x + 1]
-            for y in xrange(len(seq2)):
-                delcost = oneago[y] + 1
-                addcost = thisrow[y - 1] + 1
-                subcost = oneago[y - 1] + (seq1[x] != seq2[y])
-                thisrow[y] = min(delcost, addcost, subcost)
-        max_len = max({len(seq1),len(seq2)})
-        min_len = min({len(seq1),len(seq2)})
-        return float(max_len - thisrow[len(seq2) - 1])/float(min_len)
+        # Distances too large to reach the threshold are cut short; the result
+        # is then 0.0, which sim_measure() would have used anyway.
+        return levenshtein_sim.levenshtein_sim(seq1, seq2, levenshtein_sim.max_distance_for(
+            len(seq1), len(seq2), self.threshold))
 
     def set_sim_metric(self, method):
         """Save the current metric function in sim_metric."""
         self.method = method
         if method == "jaro":
             self.sim_metric = self.jaro_winkler_sim
+            metric = jaro.jaro_winkler
         else:
             self.sim_metric = self.levenshtein_sim
-        
+            threshold = self.threshold
+            def metric(seq1, seq2):
+                return levenshtein_sim.levenshtein_sim(seq1, seq2, levenshtein_sim.max_distance_for(
+                    len(seq1), len(seq2), threshold))
+        self.pair_cache = None
+        if self.pair_cache_mb:
+            # Both metrics are symmetric, so the pair cache can store one
+            # entry per unordered pair of words.
+            max_pairs = int(self.pair_cache_mb * 1024 * 1024 / caches.PAIR_BYTES)
+            self.pair_cache = caches.shared_pair_cache(method, self.threshold, metric, max_pairs)
+            self.sim_metric = self.pair_cache.similarity
+
     def sim_measure(self, str1_words, str2_words):
         """Measure the similarity between two strings of words, using the word-comparison similarity metric function pointed to by sim_metric."""
         if len(str1_words) == 0 or len(str2_words) == 0:
@@ -110,11 +374,240 @@ class HybridJaccard(object):
                     sim = 0.0
                 inner_arr.append(1.0 - sim)
             outer_arr.append(inner_arr)
+        return self.assignment_score(outer_arr)
+
+    def similarity_rows(self, input_words):
+        """Compare each input word to every word in the reference vocabulary.
+        Returns one row per input word: a dictionary mapping the ids of the
+        reference words that reach the threshold to their similarity.  Other
+        reference words have similarity 0.0.
+
+        Rows are kept in a bounded cache keyed by input word, so only words
+        not seen recently are compared to the vocabulary.
+
+        """
+        row_cache = self.row_cache
+        row_cache_key = (len(self.store.words), self.threshold, self.method)
+        if row_cache_key != self.row_cache_key:
+            row_cache.clear()
+            self.row_cache_key = row_cache_key
+        rows = []
+        for in_word in input_words:
+            row = row_cache.get(in_word)
+            if row is None:
+                row = self.similarity_row(in_word)
+                row_cache[in_word] = row
+            rows.append(row)
+        return rows
+
+    def similarity_row(self, in_word):
+        """Compute the similarity row of one input word, without the cache."""
+        words = self.store.words
+        row = {}
+        if self.use_vocabulary_index:
+            # Reference words left out by the index cannot reach the threshold.
+            word_ids = self.get_vocabulary_index().candidates(in_word, self.method, self.threshold)
+        else:
+            word_ids = range(len(words))
+        for word_id in word_ids:
+            sim = self.sim_metric(in_word, words[word_id])
+            if sim >= self.threshold:
+                row[word_id] = sim
+        return row
+
+    def get_vocabulary_index(self):
+        """Return the length and character-signature index of the reference
+        vocabulary, (re)building it if references have been added."""
+        index = self.vocabulary_index
+        if index is None or index.size != len(self.store.words):
+            index = vocabularyIndex.VocabularyIndex.from_store(self.store)
+            self.vocabulary_index = index
+        return index
+
+    def get_ngram_index(self):
+        """Return the character n-gram index of the reference phrases used by the
+        approximate mode, (re)building it if references have been added."""
+        index = self.ngram_index
+        if index is None or index.size != len(self.store) or index.n != self.ngram_size:
+            index = ngramIndex.NgramIndex(self.store, self.ngram_size)
+            self.ngram_index = index
+        return index
+
+    def get_phonetic_index(self):
+        """Return the phonetic blocking index of the reference phrases, (re)building
+        it if references have been added or the key methods have changed."""
+        index = self.phonetic_index
+        if index is None or index.size != len(self.store) or index.methods != self.blocking:
+            index = phoneticIndex.PhoneticIndex(self.store, self.blocking)
+            self.phonetic_index = index
+        return index
+
+    def get_exact_index(self):
+        """Return the index of verbatim phrase occurrences, (re)building it if
+        references have been added."""
+        index = self.exact_index
+        if index is None or index.size != len(self.store):
+            index = exactIndex.ExactIndex.from_store(self.store)
+            self.exact_index = index
+        return index
+
+    def exact_seed(self, input_words, phrase_indexes=None):
+        """Return the score and index of the best phrase (the first, in case of
+        ties) that occurs verbatim in the input words, or is made of exactly
+        the input words in another order, or (0.0, -1) if there is none.
+
+        Identical words have similarity 1.0, so a phrase of c words found in
+        an input of r words scores exactly c/r, and a reordering of the whole
+        input scores 1.0.  phrase_indexes, if given, limits the search to
+        those phrases.
+
+        """
+        if not self.use_exact_index or self.assignment == "greedy" or self.threshold > 1.0:
+            # Greedy pairing is not guaranteed to find the identical words.
+            return 0.0, -1
+        index = self.get_exact_index()
+        word_ids = [self.store.word_ids.get(word) for word in input_words]
+        allowed = None if phrase_indexes is None else set(phrase_indexes)
+        seed_sim, seed_index = 0.0, -1
+        idx = index.reordering(word_ids)
+        if idx >= 0 and (allowed is None or idx in allowed):
+            seed_sim, seed_index = 1.0, idx
+        for idx in index.occurrences(word_ids):
+            if allowed is not None and idx not in allowed:
+                continue
+            similarity = float(self.store.phrase_length(idx)) / len(word_ids)
+            if similarity > seed_sim or (similarity == seed_sim and idx < seed_index):
+                seed_sim, seed_index = similarity, idx
+        return seed_sim, seed_index
+
+    def shortlist(self, input_words):
+        """Return the indexes of the phrases to score for the input words: None
+        for all of them, or those passing phonetic blocking and, in
+        approximate mode, the closest approximate_k."""
+        if self.approximate_k:
+            phrase_indexes = self.get_ngram_index().query(input_words, self.approximate_k)
+            if self.blocking:
+                blocked = set(self.get_phonetic_index().query(input_words))
+                phrase_indexes = [idx for idx in phrase_indexes if idx in blocked]
+            return phrase_indexes
+        if self.blocking:
+            return self.get_phonetic_index().query(input_words)
+        return None
+
+    def sim_measure_rows(self, rows, ref_word_ids):
+        """Same as sim_measure(), with the input words given by their similarity
+        rows and the reference words by their ids."""
+        if len(rows) == 0 or len(ref_word_ids) == 0:
+            return 0.0
+        outer_arr = [[1.0 - row.get(word_id, 0.0) for word_id in ref_word_ids] for row in rows]
+        return self.assignment_score(outer_arr)
+
+    def score_bound(self, sims):
+        """Return an upper bound for the hybrid Jaccard score of a matrix of
+        similarities (input words by reference words), whatever the pairing:
+        each input word, and each reference word, contributes at most its
+        highest similarity, and the denominator is at least the larger of
+        the two word counts."""
+        row_total = sum(max(row) for row in sims)
+        column_total = sum(max(column) for column in zip(*sims))
+        # Allow for the scores being summed in a different order.
+        return (min(row_total, column_total) + vocabularyIndex.EPSILON) / max(len(sims), len(sims[0]))
+
+    def assignment_score(self, outer_arr):
+        """Find the best pairing of input words (rows) with reference words
+        (columns) in a cost matrix holding 1.0 - similarity, and return the
+        hybrid Jaccard similarity of the pairing."""
+        if self.assignment in ("greedy", "auto"):
+            pairs, conflicted = assignment.greedy_pairs(outer_arr)
+            if self.assignment == "greedy" or not conflicted:
+                return assignment.pairs_score(outer_arr, pairs)
         values = []
-        indexes = self.m.compute(outer_arr)
+        if self.thread_safe:
+            # The Munkres object keeps its working matrices on the instance.
+            indexes = munkres.Munkres().compute(outer_arr)
+        else:
+            indexes = self.m.compute(outer_arr)
         for row, column in indexes:
             values.append(1.0 - outer_arr[row][column]) #go back to similarity
-        return sum(values)/(len(str1_words)+len(str2_words)-len(values)+values.count(0.0))
+        return sum(values)/(len(outer_arr)+len(outer_arr[0])-len(values)+values.count(0.0))
+
+    def best_phrase(self, rows, phrase_indexes=None, seed=None):
+        """Scan the reference phrases for the best match to the input words whose
+        similarity rows are given. Returns the best similarity and the index
+        of the phrase that achieved it (the first one, in case of ties).
+        phrase_indexes, in increasing order, limits the scan to those phrases.
+
+        Phrases whose score_bound() is below min_score, or no higher than
+        the best score so far, are skipped without solving their assignment,
+        and so is the whole scan when no phrase could reach min_score.  A
+        best similarity below min_score therefore means that there is no
+        match, but not necessarily that no phrase scores higher.
+
+        seed, a (score, index) pair from exact_seed(), is a phrase whose score
+        is already known: phrases before it must reach that score to be
+        chosen instead, and phrases after it must exceed it.
+
+        """
+        max_sim = 0 # chosen to return None if there are no reference phrases.
+        max_sim_index = 0 # initial value does not matter
+        if len(rows) == 0:
+            return max_sim, max_sim_index
+        min_score = self.min_score
+        # Each input word contributes at most its best similarity with any
+        # reference word, and a phrase has at least as many words in the
+        # denominator as the input.
+        if (sum(max(row.values() or [0.0]) for row in rows) + vocabularyIndex.EPSILON) / len(rows) < min_score:
+            return max_sim, max_sim_index
+        store = self.store
+        phrase_words = store.phrase_words
+        phrase_offsets = store.phrase_offsets
+        if phrase_indexes is None:
+            phrase_indexes = range(len(store))
+        seed_sim, seed_index = seed if seed is not None else (0.0, -1)
+        if seed_index < 0:
+            seed_sim = 0.0
+        if self.assignment == "vectorized":
+            # Build the phrases' cost matrices first and solve them together,
+            # VECTORIZED_BATCH phrases at a time.
+            scored = []
+            cost_matrices = []
+            for idx in itertools.chain(phrase_indexes, [None]):
+                if idx is not None:
+                    ref_word_ids = phrase_words[phrase_offsets[idx]:phrase_offsets[idx + 1]]
+                    if len(ref_word_ids) == 0:
+                        continue
+                    sims = [[row.get(word_id, 0.0) for word_id in ref_word_ids] for row in rows]
+                    bound = self.score_bound(sims)
+                    if bound < min_score or bound < seed_sim or (idx > seed_index >= 0 and bound <= seed_sim):
+                        continue
+                    scored.append(idx)
+                    cost_matrices.append([[1.0 - sim for sim in sim_row] for sim_row in sims])
+                    if len(scored) < VECTORIZED_BATCH:
+                        continue
+                similarities = assignment.hybrid_scores(cost_matrices, self.assignment_score)
+                for scored_idx, similarity in zip(scored, similarities):
+                    if similarity > max_sim:
+                        max_sim = similarity
+                        max_sim_index = scored_idx
+                scored = []
+                cost_matrices = []
+            return max_sim, max_sim_index
+        for idx in phrase_indexes:
+            ref_word_ids = phrase_words[phrase_offsets[idx]:phrase_offsets[idx + 1]]
+            if len(ref_word_ids) == 0:
+                continue
+            if idx == seed_index:
+                similarity = seed_sim
+            else:
+                sims = [[row.get(word_id, 0.0) for word_id in ref_word_ids] for row in rows]
+                bound = self.score_bound(sims)
+                if bound < min_score or bound <= max_sim or bound < seed_sim or (idx > seed_index >= 0 and bound <= seed_sim):
+                    continue
+                similarity = self.assignment_score([[1.0 - sim for sim in sim_row] for sim_row in sims])
+            if similarity > max_sim:
+                max_sim = similarity
+                max_sim_index = idx
+        return max_sim, max_sim_index
 
     def findBestMatchWords(self, input_words):
         """Find the best match, without caching the result. Call directly if input
@@ -123,16 +616,135 @@ class HybridJaccard(object):
         if no match is found.
 
         """
-        max_sim = 0 # chosen to return None if reference_phrases is empty.
-        max_sim_index = 0 # initial value does not matter
-        for idx, ref_words in enumerate(self.reference_phrases):
-            similarity = self.sim_measure(input_words, ref_words)
-            if similarity > max_sim:
-                max_sim = similarity
-                max_sim_index = idx
-        if max_sim < 1e-20: # Shouldn't this threshold be parameterized?
+        label_id = self.best_label_id(input_words)
+        if label_id < 0:
+            return None
+        return self.store.label(label_id)
+
+    def best_match(self, input_words):
+        """Return the best similarity to the input words and the index of the
+        phrase that achieved it, as best_phrase() does.  An input that is made
+        of exactly the words of a phrase is answered without comparing any
+        words when the metric is Jaro-Winkler, under which only identical
+        words have similarity 1.0, so no phrase can score higher or tie
+        earlier."""
+        phrase_indexes = self.shortlist(input_words)
+        seed = self.exact_seed(input_words, phrase_indexes)
+        if seed[0] == 1.0 and self.method == "jaro":
+            return seed
+        return self.best_phrase(self.similarity_rows(input_words), phrase_indexes, seed)
+
+    def best_label_id(self, input_words):
+        """Find the best match, returning the id of its label in the reference
+        store's label table, or -1 if no match is found."""
+        max_sim, max_sim_index = self.best_match(input_words)
+        if not self.is_match(max_sim):
+            return -1
+        return int(self.store.phrase_labels[max_sim_index])
+
+    def is_match(self, max_sim):
+        """Whether a best similarity found by best_match() or best_phrase() is a
+        match: it must reach min_score, and a similarity of 0.0 never is one
+        (no phrase was scored, or none shares a word with the input)."""
+        return max_sim > 0.0 and max_sim >= self.min_score
+
+    def findBestLabelIds(self, input_word_lists):
+        """Find the best matches for a batch of word lists, without caching the
+        results. Returns an array of label ids (see best_label_id()), aligned
+        with the inputs; label_string() turns an id into a string."""
+        return array('i', [self.best_label_id(input_words) for input_words in input_word_lists])
+
+    def label_string(self, label_id):
+        """Return the label with the given id as a string, or None for -1."""
+        if label_id < 0:
             return None
-        return self.labels[max_sim_index]
+        return " ".join(self.store.label(label_id))
+
+    def max_phrase_length(self):
+        """Return the number of words in the longest reference phrase."""
+        offsets = self.store.phrase_offsets
+        return max([offsets[idx + 1] - offsets[idx] for idx in range(len(self.store))] or [0])
+
+    def findBestMatchSpans(self, text):
+        """Find reference phrases inside a longer text, such as a whole ad.
+
+        Windows of up to max_phrase_length() consecutive words are matched
+        against the references; the similarity row of each word is computed
+        once and shared by every window containing it.  The best-scoring
+        windows that do not overlap are returned, in text order, as a list of
+        (start, end, label, score) tuples, where start and end are character
+        offsets into text and label is a string.
+
+        """
+        tokens = [(m.start(), m.end(), m.group()) for m in re.finditer(r"\S+", text)]
+        rows = self.similarity_rows([token for _, _, token in tokens])
+        # A word that matches no reference word only lowers the score of a
+        # window, so windows are not allowed to begin or end with one.
+        live = [len(row) > 0 for row in rows]
+        window_length = self.max_phrase_length()
+        window_results = {} # repeated windows are scored once
+        candidates = []
+        for start in range(len(tokens)):
+            if not live[start]:
+                continue
+            for end in range(start + 1, min(start + window_length, len(tokens)) + 1):
+                if not live[end - 1]:
+                    continue
+                key = tuple(token for _, _, token in tokens[start:end])
+                result = window_results.get(key)
+                if result is None:
+                    result = self.best_phrase(rows[start:end])
+                    window_results[key] = result
+                max_sim, max_sim_index = result
+                if self.is_match(max_sim):
+                    candidates.append((-max_sim, start, end - start, max_sim_index))
+        # Take the best windows first; ties go to the earlier, then shorter, window.
+        candidates.sort()
+        taken = [False] * len(tokens)
+        spans = []
+        for neg_sim, start, length, max_sim_index in candidates:
+            if any(taken[start:start + length]):
+                continue
+            for idx in range(start, start + length):
+                taken[idx] = True
+            spans.append((tokens[start][0], tokens[start + length - 1][1],
+                          " ".join(self.store.phrase_label(max_sim_index)), -neg_sim))
+        spans.sort()
+        return spans
+
+    def cache_key(self, input_words):
+        """Return the result cache key of a list of input words: the tuple of
+        their token ids.  Each distinct input word is given a token id the
+        first time it is stored in the cache; the token table is never
+        pruned, and grows with the distinct words of the cached inputs."""
+        token_ids = self.token_ids
+        try:
+            return tuple([token_ids[word] for word in input_words])
+        except KeyError:
+            with self.token_lock:
+                for word in input_words:
+                    if word not in token_ids:
+                        token_ids[word] = len(token_ids)
+            return tuple([token_ids[word] for word in input_words])
+
+    def lookup_key(self, input_words):
+        """Return the result cache key of a list of input words without giving
+        token ids to new words, or None if one of them has none, in which
+        case the input is not in the cache."""
+        token_ids = self.token_ids
+        try:
+            return tuple([token_ids[word] for word in input_words])
+        except KeyError:
+            return None
+
+    def cached_label_id(self, input_words):
+        """Same as best_label_id(), caching the result."""
+        key = self.lookup_key(input_words)
+        label_id = self.cache.get(key) if key is not None else None
+        if label_id is None:
+            label_id = self.best_label_id(input_words)
+            self.cache[self.cache_key(input_words)] = label_id
+        return label_id
 
     def findBestMatchWordsCached(self, input_words):
         """Find the best match, caching the result.  Use if input word sequences will
@@ -140,17 +752,10 @@ class HybridJaccard(object):
         if no match is found.
 
         """
-        # Build a single string for cache lookup:
-        #
-        # TODO: The join character should be parameterized for special occasions.
-        input_str = " ".join(input_words)
-        # Look for the string in the cache.  None is an allowable result, so
-        # use False to indicate that an entry was not found.
-        result = self.cache.get(input_str, False)
-        if result is False:
-            result = self.findBestMatchWords(input_words)
-            self.cache[input_str] = result
-        return result
+        label_id = self.cached_label_id(input_words)
+        if label_id < 0:
+            return None
+        return self.store.label(label_id)
 
     def findBestMatchString(self, input_str):
         """Find the best match, without caching the result. The input is a string,
@@ -172,10 +777,55 @@ class HybridJaccard(object):
         match is found, otherwise returns a string result.
 
         """
-        # Look for the string in the cache.  None is an allowable result, so
-        # use False to indicate that an entry was not found.
-        result = self.cache.get(input_str, False)
-        if result is False:
-            result = self.findBestMatchString(input_str)
-            self.cache[input_str] = result
-        return result
+        # The cache is shared with findBestMatchWordsCached(); both store label ids.
+        return self.label_string(self.cached_label_id(input_str.split()))
+
+    def findBestMatchStringsCached(self, input_strs):
+        """Find the best matches for a batch of input strings, caching the
+        results. Duplicate strings within the batch are matched only once.
+        Returns a list of results in the same order as the inputs, each
+        either a string or the singleton value None.
+
+        """
+        results = {}
+        for input_str in input_strs:
+            if input_str not in results:
+                results[input_str] = self.findBestMatchStringCached(input_str)
+        return [results[input_str] for input_str in input_strs]
+
+    def iterBestMatches(self, input_strs, chunk_size=256, cache=True):
+        """Generate the best match for each string of an iterable, in order, as
+        findBestMatchStringCached() would.  The inputs are read chunk_size at
+        a time, so an open file can be passed directly (strings are split on
+        white space, so the newline does not matter).  Within a chunk, each
+        distinct input that is not in the cache is matched once, in a single
+        batch.
+
+        With cache=True the result cache is shared with the other "Cached"
+        methods, and keeps every distinct input of the stream, so memory
+        grows with the number of distinct inputs.  With cache=False the
+        cache is neither used nor filled, and only one chunk is held in
+        memory however long the stream is.
+
+        """
+        input_strs = iter(input_strs)
+        while True:
+            chunk = [tuple(input_str.split()) for input_str in itertools.islice(input_strs, chunk_size)]
+            if not chunk:
+                return
+            results = {}
+            pending = []
+            for input_words in chunk:
+                if input_words not in results:
+                    key = self.lookup_key(input_words) if cache else None
+                    label_id = self.cache.get(key) if key is not None else None
+                    results[input_words] = label_id
+                    if label_id is None:
+                        pending.append(input_words)
+            label_ids = self.findBestLabelIds([list(input_words) for input_words in pending])
+            for input_words, label_id in zip(pending, label_ids):
+                if cache:
+                    self.cache[self.cache_key(input_words)] = label_id
+                results[input_words] = label_id
+            for input_words in chunk:
+                yield self.label_string(results[input_words])
@@ -3,8 +3,14 @@
 from __future__ import division
 import os
 import sys
+import threading
 from typo_tables import adjwt
 
+try:
+    unicode
+except NameError: # Python 3
+    unicode = str
+
 def fn_jaro(len1, len2, num_matches, half_transposes, typo_score, typo_scale):
     """Calculate the classic Jaro metric between two strings.
 
@@ -230,19 +236,85 @@ def metric_jaro_winkler(string1, string2):
     """The Jaro metric adjusted with Winkler's modification, which boosts
     the metric for strings whose prefixes match."""
 
-    pre_scale = 0.1
+    return jaro_winkler(string1, string2)
 
-    ans = string_metrics(string1, string2,
-                             boost_threshold=0.7, pre_len=4,
-                                # typo_table=adjwt, typo_scale=type_scale,
-                                     pre_scale=pre_scale, longer_prob=False)
+# Match flag buffers, one pair per thread, reused by jaro_winkler().  Instead
+# of being cleared, they are marked with a new stamp on every call.
+_scratch = threading.local()
 
-    (len1, len2, num_matches, half_transposes,
-                                     typo_score, pre_matches, adjust_long) = ans
-    assert typo_score == int(adjust_long) == 0
+def _is_alpha(char):
+    if isinstance(char, int): # an element of a Python 3 bytes string
+        return 65 <= char <= 90 or 97 <= char <= 122
+    return char.isalpha()
+
+def jaro_winkler(s1, s2):
+    """Single-pass equivalent of metric_jaro_winkler().
+
+    Returns exactly the same values, without the argument checks, the
+    intermediate tuples or the second Jaro computation, and without
+    allocating match flags on each call.  Both arguments may also be bytes
+    (for ASCII-only vocabularies), as long as they are of the same type."""
+    len1 = len(s1)
+    len2 = len(s2)
+    if len2 < len1:
+        s1, s2 = s2, s1
+        len1, len2 = len2, len1
+    if not len1:
+        if not len2: return 1.0
+        return 0.0
 
-    weight_jaro = fn_jaro(len1, len2, num_matches, half_transposes, 0, 1)
-    return fn_winkler(weight_jaro, pre_matches, pre_scale)
+    try:
+        flags1, flags2 = _scratch.flags
+        stamp = _scratch.stamp + 1
+    except AttributeError:
+        flags1, flags2 = _scratch.flags = [], []
+        stamp = 1
+    _scratch.stamp = stamp
+    if len(flags2) < len2:
+        flags1.extend([0] * (len2 - len(flags1)))
+        flags2.extend([0] * (len2 - len(flags2)))
+
+    # Count the matched characters, as count_matches() does.
+    search_range = max(len2//2-1, 0)
+    num_matches = 0
+    for i in range(len1):
+        char = s1[i]
+        lolim = i - search_range
+        if lolim < 0: lolim = 0
+        hilim = i + search_range + 1
+        if hilim > len2: hilim = len2
+        for j in range(lolim, hilim):
+            if flags2[j] != stamp and char == s2[j]:
+                flags1[i] = flags2[j] = stamp
+                num_matches += 1
+                break
+    if not num_matches: return 0.0
+
+    # Count the half transpositions, as count_half_transpositions() does.
+    half_transposes = 0
+    k = 0
+    for i in range(len1):
+        if flags1[i] != stamp: continue
+        while flags2[k] != stamp: k += 1
+        if s1[i] != s2[k]:
+            half_transposes += 1
+        k += 1
+
+    # fn_jaro() without typos, followed by fn_winkler() with the prefix
+    # boost of string_metrics() (boost_threshold=0.7, pre_len=4).
+    weight = (  num_matches / len1
+              + num_matches / len2
+              + (num_matches - half_transposes//2) / num_matches) / 3
+    if weight > 0.7:
+        pre_matches = 0
+        limit = min(len1, 4)
+        while pre_matches < limit:
+            char1 = s1[pre_matches]
+            if not (_is_alpha(char1) and char1 == s2[pre_matches]):
+                break
+            pre_matches += 1
+        weight += pre_matches * 0.1 * (1.0 - weight)
+    return weight
 
 def metric_original(string1, string2):
     """The same metric that would be returned from the reference Jaro-Winkler
@@ -0,0 +1,68 @@
+# coding: utf8
+"""Compare jaro.jaro_winkler() with the multi-step Jaro-Winkler computation.
+
+The reference value is computed the way metric_jaro_winkler() did before
+jaro_winkler() replaced it: string_metrics(), then fn_jaro() and
+fn_winkler().  Random pairs are drawn from a small alphabet with repeated,
+non-ASCII, upper case, digit and separator characters, so that matches,
+transpositions and the prefix boost all occur often.  ASCII pairs are also
+compared as bytes.  The exit status is 1 if any result differs.
+
+"""
+import argparse
+import random
+import sys
+import jaro
+
+ALPHABET = u"aabbcdeeéAB1 -"
+
+def reference_jaro_winkler(string1, string2):
+    "Jaro-Winkler through string_metrics(), fn_jaro() and fn_winkler()."
+    pre_scale = 0.1
+    (len1, len2, num_matches, half_transposes,
+     typo_score, pre_matches, adjust_long) = jaro.string_metrics(string1, string2,
+                                                                 boost_threshold=0.7, pre_len=4,
+                                                                 pre_scale=pre_scale, longer_prob=False)
+    weight_jaro = jaro.fn_jaro(len1, len2, num_matches, half_transposes, 0, 1)
+    return jaro.fn_winkler(weight_jaro, pre_matches, pre_scale)
+
+def random_string(rng, max_len):
+    return u"".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_len)))
+
+def compare(pairs, seed=0, max_len=9):
+    """Compare 'pairs' random pairs.  Returns the list of (s1, s2, expected,
+    got) for every pair whose results differ."""
+    rng = random.Random(seed)
+    differences = []
+    for _ in range(pairs):
+        s1 = random_string(rng, max_len)
+        s2 = random_string(rng, max_len)
+        expected = reference_jaro_winkler(s1, s2)
+        for got in (jaro.jaro_winkler(s1, s2), jaro.metric_jaro_winkler(s1, s2)):
+            if got != expected:
+                differences.append((s1, s2, expected, got))
+        b1 = s1.replace(u"é", u"e").encode("ascii")
+        b2 = s2.replace(u"é", u"e").encode("ascii")
+        expected = reference_jaro_winkler(b1.decode("ascii"), b2.decode("ascii"))
+        got = jaro.jaro_winkler(b1, b2)
+        if got != expected:
+            differences.append((b1, b2, expected, got))
+    return differences
+
+def main():
+    "Command line interface: compare jaro_winkler() with the reference computation on random pairs."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n','--pairs', help="Number of random pairs.", type=int, default=200000)
+    parser.add_argument('--seed', help="Random seed.", type=int, default=0)
+    args = parser.parse_args()
+
+    differences = compare(args.pairs, args.seed)
+    for s1, s2, expected, got in differences[:20]:
+        print("%r %r: expected %r, got %r" % (s1, s2, expected, got))
+    print("%d pairs, %d differences" % (args.pairs, len(differences)))
+    return 1 if differences else 0
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+"""Levenshtein similarity as used by HybridJaccard.
+
+The similarity of two strings is (max_len - distance) / min_len, where
+distance is the Levenshtein edit distance and max_len and min_len are the
+lengths of the longer and shorter string.  Note that the normalization uses
+the shorter length, so a string that can be turned into the other by
+insertions alone scores 1.0:
+
+>>> levenshtein_sim("kitten", "sitting")
+0.6666666666666666
+>>> levenshtein_sim("blue", "blue")
+1.0
+>>> levenshtein_sim("blue", "bleu")
+0.5
+>>> levenshtein_sim("grey", "gray")
+0.75
+>>> levenshtein_sim("brown", "blond")
+0.4
+>>> levenshtein_sim("a", "abc"), levenshtein_sim("abc", "a")
+(1.0, 1.0)
+>>> levenshtein_sim("x", "y")
+0.0
+
+With max_distance, the computation stops as soon as every entry of a row of
+the distance table exceeds it, and 0.0 is returned:
+
+>>> levenshtein_sim("kitten", "sitting", max_distance=2)
+0.0
+>>> levenshtein_sim("kitten", "sitting", max_distance=3)
+0.6666666666666666
+
+Empty strings follow the Jaro functions: two empty strings are identical,
+and an empty string has nothing in common with any other.
+
+>>> levenshtein_sim("", ""), levenshtein_sim("", "abc")
+(1.0, 0.0)
+
+"""
+import sys
+import threading
+
+# Two row buffers per thread, reused by every call and grown as needed.
+_scratch = threading.local()
+
+def max_distance_for(len1, len2, threshold):
+    """Return the largest edit distance at which two strings of lengths len1
+    and len2 can still reach a similarity of 'threshold'.  A small allowance
+    for rounding keeps the cutoff from rejecting a pair that would pass."""
+    return max(len1, len2) - threshold * min(len1, len2) + 1e-9
+
+def levenshtein_sim(seq1, seq2, max_distance=None):
+    """Return the Levenshtein similarity of seq1 and seq2 (see the module
+    documentation), or 0.0 if their edit distance is certain to exceed
+    max_distance."""
+    len1 = len(seq1)
+    len2 = len(seq2)
+    if len2 > len1:
+        # The distance is symmetric; keep the rows short.
+        seq1, seq2 = seq2, seq1
+        len1, len2 = len2, len1
+    if not len2:
+        if not len1:
+            return 1.0
+        return 0.0
+    try:
+        prev, cur = _scratch.rows
+    except AttributeError:
+        prev, cur = [], []
+        _scratch.rows = prev, cur
+    if len(prev) <= len2:
+        prev.extend([0] * (len2 + 1 - len(prev)))
+        cur.extend([0] * (len2 + 1 - len(cur)))
+    for y in range(len2 + 1):
+        prev[y] = y
+    for x in range(len1):
+        char1 = seq1[x]
+        cur[0] = row_min = x + 1
+        for y in range(len2):
+            cost = prev[y] + (char1 != seq2[y]) # substitution
+            other = prev[y + 1] + 1 # deletion
+            if other < cost:
+                cost = other
+            other = cur[y] + 1 # insertion
+            if other < cost:
+                cost = other
+            cur[y + 1] = cost
+            if cost < row_min:
+                row_min = cost
+        if max_distance is not None and row_min > max_distance:
+            # The final distance is at least the smallest entry of any row.
+            return 0.0
+        prev, cur = cur, prev
+    return float(len1 - prev[len2]) / float(len2)
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        sys.exit()
+
+    print('Levenshtein similarity: %7.5f' % levenshtein_sim(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,196 @@
+"""Check that the exact matching settings give the results of a plain scan.
+
+The expected label of each input is computed without any of HybridJaccard's
+shortcuts: every input word is compared to every reference word, every
+reference phrase is scored with the Munkres algorithm, and the first phrase
+with the highest score wins.  The inputs are then matched with instances
+using each setting to check -- the assignment methods, min_score pruning,
+with and without the vocabulary and exact indexes, in thread-safe mode
+with several threads, over a compiled (memory-mapped) store and after a
+snapshot round trip -- and every input whose label differs is reported.
+The exit status is 1 if any label differs.
+
+Inputs built from the reference phrases (each phrase, the phrase between
+two other words, and its words reversed) are added to the sample inputs,
+so that the exact index finds verbatim occurrences and reorderings.
+
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing.dummy import Pool
+import hybridJaccard as hj
+import jaro
+import levenshtein_sim
+import munkres
+import sampleInputs
+
+def plain_matches(sm, inputs):
+    """Return the best similarity and the index of the first phrase reaching it
+    for each input, found by a plain scan of sm's reference phrases with
+    sm's metric and threshold."""
+    if sm.method == "jaro":
+        metric = jaro.jaro_winkler
+    else:
+        metric = levenshtein_sim.levenshtein_sim
+    store = sm.store
+    words = store.words
+    phrases = [store.phrase_word_ids(idx) for idx in range(len(store))]
+    solver = munkres.Munkres()
+    rows = {} # input word -> similarity to each reference word
+    matches = []
+    for input_words in inputs:
+        for in_word in input_words:
+            if in_word not in rows:
+                row = [metric(in_word, ref_word) for ref_word in words]
+                rows[in_word] = [sim if sim >= sm.threshold else 0.0 for sim in row]
+        max_sim, max_sim_index = 0.0, 0
+        for idx, ref_word_ids in enumerate(phrases):
+            if len(input_words) == 0 or len(ref_word_ids) == 0:
+                continue
+            cost = [[1.0 - rows[in_word][word_id] for word_id in ref_word_ids] for in_word in input_words]
+            values = [1.0 - cost[row][column] for row, column in solver.compute(cost)]
+            similarity = sum(values)/(len(cost)+len(cost[0])-len(values)+values.count(0.0))
+            if similarity > max_sim:
+                max_sim, max_sim_index = similarity, idx
+        matches.append((max_sim, max_sim_index))
+    return matches
+
+def phrase_inputs(sm, step=1):
+    """Return inputs built from every step-th reference phrase: the phrase, the
+    phrase between two other words, and its words in reverse order."""
+    inputs = []
+    for idx in range(0, len(sm.store), step):
+        phrase = sm.store.phrase(idx)
+        inputs.extend([phrase, ["my"] + phrase + ["eyes"], list(reversed(phrase))])
+    return inputs
+
+def match_all(sm, inputs, threads=4):
+    """Match the inputs with the result cache, from several threads at once if
+    sm is thread-safe."""
+    if not sm.thread_safe:
+        return [sm.findBestMatchWordsCached(input_words) for input_words in inputs]
+    pool = Pool(threads)
+    try:
+        return pool.map(sm.findBestMatchWordsCached, inputs, chunksize=8)
+    finally:
+        pool.close()
+        pool.join()
+
+def variants(new_matcher, assignments, min_scores, inputs, work_dir):
+    """Return the settings to check, as (name, function creating a matcher)
+    pairs."""
+    def configured(**settings):
+        def make():
+            sm = new_matcher()
+            for attribute, value in settings.items():
+                setattr(sm, attribute, value)
+            return sm
+        return make
+    def thread_safe():
+        return new_matcher(thread_safe=True)
+    def mapped():
+        store_path = os.path.join(work_dir, "references.hjrs")
+        new_matcher().save_reference_store(store_path)
+        return new_matcher(store_path=store_path)
+    def snapshot():
+        # Half of the results come from the saved cache, half are matched again.
+        sm = new_matcher()
+        for input_words in inputs[::2]:
+            sm.findBestMatchWordsCached(input_words)
+        snapshot_path = os.path.join(work_dir, "matcher.snapshot")
+        sm.save_snapshot(snapshot_path, include_cache=True)
+        return hj.HybridJaccard.load_snapshot(snapshot_path)
+    result = []
+    for min_score in [None] + min_scores:
+        settings = {} if min_score is None else {"min_score": min_score}
+        suffix = "" if min_score is None else " min_score=%s" % min_score
+        for method in assignments:
+            result.append(("assignment=%s%s" % (method, suffix), configured(assignment=method, **settings)))
+        result.append(("exact_index=false%s" % suffix, configured(use_exact_index=False, **settings)))
+    result.extend([("vocabulary_index=false", configured(use_vocabulary_index=False)),
+                   ("thread_safe", thread_safe),
+                   ("mapped store", mapped),
+                   ("snapshot", snapshot)])
+    return result
+
+def main():
+    "Command line interface: compare the exact matching settings with a plain scan."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-i','--input', help="Input file of phrases (text or JSON lines).", required=True)
+    parser.add_argument('-n','--maxInputs', help="Check at most this many distinct sample inputs.", type=int, default=0)
+    parser.add_argument('-p','--phraseStep', help="Add inputs built from every n-th reference phrase (0: none).",
+                        type=int, default=1)
+    parser.add_argument('-a','--assignments', help="Comma-separated exact assignment methods.",
+                        default="optimal,vectorized,auto")
+    parser.add_argument('-s','--minScores', help="Comma-separated min_score values to check.", default="0.3,0.6")
+    args = parser.parse_args()
+
+    config_data = None
+    if args.configFile:
+        with open(args.configFile, 'r') as config_file:
+            config_data = json.load(config_file)
+    def new_matcher(thread_safe=False, store_path=None):
+        if store_path is None:
+            return hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                                    method_type=args.methodType, thread_safe=thread_safe)
+        # The compiled store already holds the references; only the settings
+        # are taken from the configuration.
+        sm = hj.HybridJaccard(method_type=args.methodType, thread_safe=thread_safe, store_path=store_path)
+        if config_data:
+            data = json.loads(json.dumps(config_data))
+            section = data.get(args.methodType) or {}
+            section.pop("references", None)
+            section.pop("references_files", None)
+            sm.build_configuration(data)
+        return sm
+
+    sm = new_matcher()
+    inputs = []
+    seen = set()
+    sample_inputs = sampleInputs.read_inputs(args.input)
+    if args.maxInputs:
+        sample_inputs = sample_inputs[:args.maxInputs]
+    if args.phraseStep > 0:
+        sample_inputs.extend(phrase_inputs(sm, args.phraseStep))
+    for input_words in sample_inputs:
+        if tuple(input_words) not in seen:
+            seen.add(tuple(input_words))
+            inputs.append(input_words)
+    start = time.time()
+    expected = plain_matches(sm, inputs)
+    print("%d inputs, %d reference phrases, plain scan %.3fs" % (len(inputs), len(sm.store), time.time() - start))
+    min_scores = [float(min_score) for min_score in args.minScores.split(",") if min_score]
+    work_dir = tempfile.mkdtemp()
+    failed = False
+    try:
+        for name, make in variants(new_matcher, [method for method in args.assignments.split(",") if method],
+                                   min_scores, inputs, work_dir):
+            sm = make()
+            start = time.time()
+            results = match_all(sm, inputs)
+            seconds = time.time() - start
+            labels = [sm.store.phrase_label(max_sim_index) if sm.is_match(max_sim) else None
+                      for max_sim, max_sim_index in expected]
+            differences = [(input_words, result, label) for input_words, result, label
+                           in zip(inputs, results, labels) if result != label]
+            for input_words, result, label in differences[:10]:
+                print("  %s => %s, expected %s" % (" ".join(input_words), " ".join(result) if result else "NONE",
+                                                   " ".join(label) if label else "NONE"))
+            print("%s: %.3fs, %d differences" % (name, seconds, len(differences)))
+            failed = failed or bool(differences)
+    finally:
+        shutil.rmtree(work_dir)
+    return 1 if failed else 0
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
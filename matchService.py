@@ -0,0 +1,156 @@
+"""An asyncio front end for HybridJaccard (Python 3 only).
+
+MatchService accepts match requests from many coroutines.  Requests for a
+phrase that is already being matched wait for the pending result instead of
+starting another scan, and distinct phrases arriving within a short window
+are collected into a single call to findBestMatchStringsCached(), which runs
+in an executor so that the event loop is never blocked by matching.
+
+serve() exposes a MatchService over a minimal HTTP interface:
+
+    GET /match?q=beautiful+light+bluish+eyes
+
+returns a JSON object such as {"input": "...", "match": "blue"}.
+
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import sys
+import urllib.parse
+
+import hybridJaccard as hj
+
+class MatchService(object):
+    def __init__(self, matcher, executor=None, batch_window=0.002, max_batch=256):
+        """'matcher' is a HybridJaccard instance.  The default executor runs one
+        batch at a time; if a multithreaded executor is supplied, the matcher
+        should have been created with thread_safe=True.
+
+        """
+        self.matcher = matcher
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.inflight = {} # input string -> future shared by all waiters
+        self.pending = []  # input strings waiting for the next batch
+        self.flush_handle = None
+
+    async def match(self, input_str):
+        """Return the best match for input_str, as findBestMatchStringCached() would."""
+        future = self.inflight.get(input_str)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[input_str] = future
+            self.pending.append(input_str)
+            if len(self.pending) >= self.max_batch:
+                self.flush()
+            elif self.flush_handle is None:
+                self.flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush)
+        # Several requests may wait on the same future; shield it so that one
+        # cancelled request does not cancel the others.
+        return await asyncio.shield(future)
+
+    def flush(self):
+        """Send the pending inputs to the executor as one batch."""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        loop = asyncio.get_running_loop()
+        try:
+            work = loop.run_in_executor(self.executor, self.matcher.findBestMatchStringsCached, batch)
+        except Exception as error: # e.g. the executor has been shut down by close()
+            self.fail(batch, error)
+            return
+        work.add_done_callback(lambda done: self.finish(batch, done))
+
+    def finish(self, batch, done):
+        if done.cancelled():
+            self.fail(batch, None)
+            return
+        error = done.exception()
+        if error is not None:
+            self.fail(batch, error)
+            return
+        results = done.result()
+        for idx, input_str in enumerate(batch):
+            future = self.inflight.pop(input_str, None)
+            if future is not None and not future.done():
+                future.set_result(results[idx])
+
+    def fail(self, batch, error):
+        """Resolve the futures of a batch that could not be matched: they get
+        'error', or are cancelled if it is None.  The inputs are removed from
+        inflight, so later requests for them start a new batch."""
+        for input_str in batch:
+            future = self.inflight.pop(input_str, None)
+            if future is None or future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+async def handle_http(service, reader, writer):
+    """Answer one HTTP/1.0-style request, then close the connection."""
+    try:
+        request_line = (await reader.readline()).decode("latin-1")
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass # Headers are not used.
+        parts = request_line.split()
+        url = urllib.parse.urlsplit(parts[1]) if len(parts) >= 2 else None
+        if url is None or parts[0] != "GET" or url.path != "/match":
+            status, body = "404 Not Found", {"error": "use GET /match?q=<phrase>"}
+        else:
+            input_str = urllib.parse.parse_qs(url.query).get("q", [""])[0]
+            status, body = "200 OK", {"input": input_str, "match": await service.match(input_str)}
+        payload = json.dumps(body).encode("utf-8")
+        writer.write(("HTTP/1.0 %s\r\nContent-Type: application/json\r\n"
+                      "Content-Length: %d\r\n\r\n" % (status, len(payload))).encode("latin-1"))
+        writer.write(payload)
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(service, host="127.0.0.1", port=8080):
+    """Start an HTTP server for the service.  The default host is the loopback
+    interface.  Returns the asyncio server object.
+
+    """
+    return await asyncio.start_server(lambda r, w: handle_http(service, r, w), host, port)
+
+def main():
+    "Command line interface: run the matching service over HTTP."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('--host', help="Address to listen on.", default="127.0.0.1")
+    parser.add_argument('-p','--port', help="Port to listen on.", type=int, default=8080)
+    parser.add_argument('-w','--batchWindow', help="Batching window in seconds.", type=float, default=0.002)
+    args = parser.parse_args()
+
+    sm = hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                          method_type=args.methodType)
+    service = MatchService(sm, batch_window=args.batchWindow)
+
+    async def run():
+        server = await serve(service, args.host, args.port)
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(run())
+    finally:
+        service.close()
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
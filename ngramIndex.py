@@ -0,0 +1,64 @@
+import heapq
+import math
+
+def phrase_ngrams(words, n):
+    """Return the character n-grams of a phrase, with counts.  The words are
+    joined by single spaces and padded with a space at each end, so that
+    word boundaries contribute n-grams of their own."""
+    text = " " + " ".join(words) + " "
+    grams = {}
+    for idx in range(max(len(text) - n + 1, 1)):
+        gram = text[idx:idx + n]
+        grams[gram] = grams.get(gram, 0) + 1
+    return grams
+
+class NgramIndex(object):
+    """Approximate retrieval of reference phrases by the cosine similarity of
+    their TF-IDF weighted character n-gram vectors.
+
+    The vectors are kept in an inverted index (n-gram -> postings of phrase
+    index and weight), so a query only touches the phrases that share at
+    least one n-gram with it.
+
+    """
+    def __init__(self, store, n=3):
+        self.n = n
+        self.size = len(store)
+        phrase_grams = [phrase_ngrams(store.phrase(idx), n) for idx in range(self.size)]
+        document_counts = {}
+        for grams in phrase_grams:
+            for gram in grams:
+                document_counts[gram] = document_counts.get(gram, 0) + 1
+        self.idf = dict((gram, math.log(float(self.size + 1) / (count + 1)) + 1.0)
+                        for gram, count in document_counts.items())
+        self.postings = {} # n-gram -> list of (phrase index, weight)
+        for idx, grams in enumerate(phrase_grams):
+            vector = self.vector(grams)
+            for gram, weight in vector.items():
+                self.postings.setdefault(gram, []).append((idx, weight))
+
+    def vector(self, grams):
+        """Return the L2-normalized TF-IDF vector of a bag of n-grams, leaving out
+        n-grams that do not occur in the references."""
+        vector = {}
+        for gram, count in grams.items():
+            idf = self.idf.get(gram)
+            if idf is not None:
+                vector[gram] = count * idf
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if norm:
+            for gram in vector:
+                vector[gram] /= norm
+        return vector
+
+    def query(self, input_words, k):
+        """Return the indexes of (at most) the k reference phrases closest to the
+        input words, in increasing index order."""
+        scores = {}
+        for gram, weight in self.vector(phrase_ngrams(input_words, self.n)).items():
+            for idx, phrase_weight in self.postings[gram]:
+                scores[idx] = scores.get(idx, 0.0) + weight * phrase_weight
+        if len(scores) > k:
+            top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+            return sorted(idx for idx, _ in top)
+        return sorted(scores)
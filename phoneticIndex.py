@@ -0,0 +1,153 @@
+SOUNDEX_CODES = {}
+for letters, code in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")):
+    for letter in letters:
+        SOUNDEX_CODES[letter] = code
+
+VOWELS = frozenset("aeiouy")
+
+def letters_of(word):
+    return "".join(char for char in word.lower() if "a" <= char <= "z")
+
+def soundex(word):
+    """Return the American Soundex code of a word ("Robert" -> "R163").  Words
+    without ASCII letters are their own code."""
+    letters = letters_of(word)
+    if not letters:
+        return word
+    code = letters[0].upper()
+    last = SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit is not None and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in "hw": # h and w do not separate equal codes
+            last = digit
+    return (code + "000")[:4]
+
+def metaphone(word):
+    """Return a simplified Metaphone key of a word: consonant sounds, with an
+    initial vowel written as "A".  Unlike Soundex, the first letter is coded
+    by sound, so "Christina" and "Kristina" share the key "KRSTN".  Words
+    without ASCII letters are their own key."""
+    letters = letters_of(word)
+    if not letters:
+        return word
+    for prefix in ("ae", "gn", "kn", "pn", "wr"):
+        if letters.startswith(prefix):
+            letters = letters[1:]
+            break
+    if letters.startswith("x"):
+        letters = "s" + letters[1:]
+    elif letters.startswith("wh"):
+        letters = "w" + letters[2:]
+    key = []
+    length = len(letters)
+    for idx, letter in enumerate(letters):
+        prev = letters[idx - 1] if idx > 0 else ""
+        following = letters[idx + 1] if idx + 1 < length else ""
+        after = letters[idx + 2] if idx + 2 < length else ""
+        if letter == prev and letter != "c":
+            continue
+        if letter in VOWELS and letter != "y":
+            if idx == 0:
+                key.append("A")
+        elif letter == "b":
+            if not (prev == "m" and idx + 1 == length):
+                key.append("B")
+        elif letter == "c":
+            if following in ("i", "e", "y"):
+                key.append("S")
+            elif following == "h":
+                # Greek "chr"/"chl" and "sch" sound like k.
+                key.append("K" if after in ("r", "l") or prev == "s" else "X")
+            else:
+                key.append("K")
+        elif letter == "d":
+            key.append("J" if following == "g" and after in ("e", "i", "y") else "T")
+        elif letter == "g":
+            if following == "h" and after not in VOWELS:
+                continue
+            if following == "n" and idx + 2 == length:
+                continue
+            key.append("J" if following in ("e", "i", "y") else "K")
+        elif letter == "h":
+            if prev not in ("c", "s", "p", "t", "g") and following in VOWELS:
+                key.append("H")
+        elif letter == "k":
+            if prev != "c":
+                key.append("K")
+        elif letter == "p":
+            key.append("F" if following == "h" else "P")
+        elif letter == "q":
+            key.append("K")
+        elif letter == "s":
+            key.append("X" if following == "h" or (following == "i" and after in ("o", "a")) else "S")
+        elif letter == "t":
+            if following == "i" and after in ("o", "a"):
+                key.append("X")
+            elif following == "h":
+                key.append("0")
+            elif not (following == "c" and after == "h"):
+                key.append("T")
+        elif letter == "v":
+            key.append("F")
+        elif letter in ("w", "y"):
+            if following in VOWELS:
+                key.append(letter.upper())
+        elif letter == "x":
+            key.append("KS")
+        elif letter == "z":
+            key.append("S")
+        else: # f, j, l, m, n, r
+            key.append(letter.upper())
+    return "".join(key)
+
+KEY_FUNCTIONS = {"soundex": soundex, "metaphone": metaphone}
+
+def parse_methods(methods_string):
+    """Parse the "blocking" configuration parameter, a comma-separated list of
+    key methods, into a tuple.  "none" (or an empty string) turns blocking
+    off."""
+    methods = tuple(method.strip() for method in methods_string.split(",") if method.strip())
+    if methods == ("none",):
+        return ()
+    for method in methods:
+        if method not in KEY_FUNCTIONS:
+            raise ValueError("unknown blocking method %s" % method)
+    return methods
+
+class PhoneticIndex(object):
+    """Blocking of reference phrases by the phonetic keys of their words.
+
+    Every reference word gets one key per method (Soundex, Metaphone), and
+    query() returns the phrases that contain a word sharing a key with an
+    input word.  Spelling variants that sound alike ("Kristina",
+    "Christina") are found without comparing the input to every phrase;
+    variants that do not share a key are missed, so the candidates are an
+    approximation of the full scan.
+
+    """
+    def __init__(self, store, methods):
+        self.methods = methods
+        self.size = len(store)
+        functions = [(method, KEY_FUNCTIONS[method]) for method in methods]
+        word_keys = [[(method, function(word)) for method, function in functions] for word in store.words]
+        self.postings = {} # (method, key) -> increasing phrase indexes
+        for idx in range(self.size):
+            for word_id in set(store.phrase_word_ids(idx)):
+                for key in word_keys[word_id]:
+                    postings = self.postings.setdefault(key, [])
+                    if not postings or postings[-1] != idx:
+                        postings.append(idx)
+        self.functions = functions
+
+    def query(self, input_words):
+        """Return the indexes of the reference phrases that have a word sharing a
+        phonetic key with one of the input words, in increasing order."""
+        found = set()
+        for word in input_words:
+            for method, function in self.functions:
+                found.update(self.postings.get((method, function(word)), ()))
+        return sorted(found)
@@ -0,0 +1,323 @@
+from array import array
+import mmap
+import struct
+import sys
+import warnings
+import exactIndex
+import vocabularyIndex
+
+STORE_MAGIC = b"HJRS"
+STORE_VERSION = 1
+HEADER = struct.Struct("<4sIc3xI") # magic, version, byte order, section count
+SECTION = struct.Struct("<16sc7xQQ") # name, array typecode, byte offset, item count
+
+class ReferenceStore(object):
+    """Compact storage for reference phrases and their labels.
+
+    Every distinct word is stored once, in the vocabulary, and identified by
+    its index there (its word id).  The word ids of all phrases are
+    concatenated in a single integer array; phrase i occupies
+    phrase_words[phrase_offsets[i]:phrase_offsets[i + 1]].  Labels are kept
+    the same way in a table of unique labels, and phrase_labels maps each
+    phrase to its label id, so that aliases share their main phrase's label.
+    The dictionaries that find existing phrases and labels are only needed
+    while phrases are added; freeze() drops them once the references are
+    loaded, and they are rebuilt from the arrays if more are added.
+
+    Phrases are deduplicated as they are added: a phrase that is already
+    present (word for word, so differences in white space do not count) is
+    not stored again.  If the repeated phrase has a different label, the
+    first label is kept and the clash is recorded in 'conflicts'.
+
+    """
+    def __init__(self):
+        self.words = []     # word id -> word
+        self.word_ids = {}  # word -> word id
+        self.phrase_words = array('i')
+        self.phrase_offsets = array('i', [0])
+        self.phrase_labels = array('i')
+        self.label_words = array('i')
+        self.label_offsets = array('i', [0])
+        self.label_ids = {} # tuple of word ids -> label id
+        self.phrase_ids = {} # tuple of word ids -> phrase index
+        self.duplicates = 0 # repeated phrases with the same label
+        self.conflicts = [] # (phrase words, kept label words, dropped label words)
+
+    def __len__(self):
+        """Return the number of phrases."""
+        return len(self.phrase_labels)
+
+    def word_id(self, word):
+        """Return the id of a word, adding it to the vocabulary if necessary."""
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = len(self.words)
+            self.words.append(word)
+            self.word_ids[word] = word_id
+        return word_id
+
+    def freeze(self):
+        """Drop the phrase and label lookup tables, which make up most of the
+        store's memory, until more phrases are added."""
+        self.label_ids = None
+        self.phrase_ids = None
+
+    def thaw(self):
+        """Rebuild the lookup tables dropped by freeze()."""
+        self.label_ids = {}
+        for label_id in range(len(self.label_offsets) - 1):
+            start, end = self.label_offsets[label_id], self.label_offsets[label_id + 1]
+            self.label_ids[tuple(self.label_words[start:end])] = label_id
+        self.phrase_ids = {}
+        for idx in range(len(self)):
+            self.phrase_ids[tuple(self.phrase_word_ids(idx))] = idx
+
+    def label_id(self, label_words):
+        """Return the id of a label, given as a list of words, adding it to the
+        label table if necessary."""
+        if self.label_ids is None:
+            self.thaw()
+        key = tuple(self.word_id(word) for word in label_words)
+        label_id = self.label_ids.get(key)
+        if label_id is None:
+            label_id = len(self.label_offsets) - 1
+            self.label_words.extend(key)
+            self.label_offsets.append(len(self.label_words))
+            self.label_ids[key] = label_id
+        return label_id
+
+    def add_phrase(self, phrase_words, label_words):
+        """Append a phrase and its label, both given as lists of words. Returns
+        the index of the phrase, which is the index of the earlier copy if the
+        phrase was already present, or None for an empty phrase."""
+        if not phrase_words:
+            return None # An empty phrase can never match anything.
+        key = tuple(self.word_id(word) for word in phrase_words)
+        label_id = self.label_id(label_words) # rebuilds both tables after freeze()
+        idx = self.phrase_ids.get(key)
+        if idx is not None:
+            # The earlier copy wins every tie, so the new one could never be
+            # the best match.
+            if self.phrase_labels[idx] == label_id:
+                self.duplicates += 1
+            else:
+                self.conflicts.append((list(phrase_words), self.phrase_label(idx), list(label_words)))
+            return idx
+        self.phrase_words.extend(key)
+        self.phrase_offsets.append(len(self.phrase_words))
+        self.phrase_labels.append(label_id)
+        idx = len(self.phrase_labels) - 1
+        self.phrase_ids[key] = idx
+        return idx
+
+    def partition(self, start, end):
+        """Return a new store holding phrases start to end - 1, in order, with
+        their labels."""
+        store = ReferenceStore()
+        for idx in range(start, end):
+            store.add_phrase(self.phrase(idx), self.phrase_label(idx))
+        store.freeze()
+        return store
+
+    def reference_lines(self):
+        """Return the phrases in the reference file format, one line per run of
+        consecutive phrases that share a label, main phrase first.  Reading the
+        lines back produces the same phrases in the same order."""
+        lines = []
+        idx = 0
+        while idx < len(self):
+            label_id = self.phrase_labels[idx]
+            label = self.label(label_id)
+            aliases = []
+            while idx < len(self) and self.phrase_labels[idx] == label_id:
+                phrase = self.phrase(idx)
+                if phrase != label:
+                    aliases.append(" ".join(phrase))
+                idx += 1
+            line = " ".join(label)
+            if aliases:
+                line += ": " + ", ".join(aliases)
+            lines.append(line)
+        return lines
+
+    def phrase_word_ids(self, idx):
+        return self.phrase_words[self.phrase_offsets[idx]:self.phrase_offsets[idx + 1]]
+
+    def phrase_length(self, idx):
+        """Return the number of words in phrase idx."""
+        return self.phrase_offsets[idx + 1] - self.phrase_offsets[idx]
+
+    def phrase(self, idx):
+        """Return phrase idx as a list of words."""
+        words = self.words
+        return [words[word_id] for word_id in self.phrase_word_ids(idx)]
+
+    def label(self, label_id):
+        """Return label label_id as a list of words."""
+        words = self.words
+        start, end = self.label_offsets[label_id], self.label_offsets[label_id + 1]
+        return [words[word_id] for word_id in self.label_words[start:end]]
+
+    def phrase_label(self, idx):
+        """Return the label of phrase idx as a list of words."""
+        return self.label(self.phrase_labels[idx])
+
+    def sections(self):
+        """Return the arrays that make up the store, as (name, array) pairs."""
+        codepoints = array('I')
+        word_offsets = array('i', [0])
+        for word in self.words:
+            if not isinstance(word, type(u"")):
+                word = word.decode("utf-8")
+            codepoints.extend(ord(char) for char in word)
+            word_offsets.append(len(codepoints))
+        decoded = [codepoints[word_offsets[i]:word_offsets[i + 1]].tolist() for i in range(len(self.words))]
+        sorted_words = array('i', sorted(range(len(self.words)), key=decoded.__getitem__))
+        index = vocabularyIndex.VocabularyIndex.build(self.words)
+        return [("vocabulary", codepoints),
+                ("word_offsets", word_offsets),
+                ("sorted_words", sorted_words),
+                ("phrase_words", self.phrase_words),
+                ("phrase_offsets", self.phrase_offsets),
+                ("phrase_labels", self.phrase_labels),
+                ("label_words", self.label_words),
+                ("label_offsets", self.label_offsets),
+                ("word_masks", index.masks),
+                ("words_by_length", index.by_length)] + exactIndex.ExactIndex.build(self).sections()
+
+    def save(self, path):
+        """Write the store to a file that MappedReferenceStore can map."""
+        sections = list(self.sections())
+        offset = HEADER.size + SECTION.size * len(sections)
+        table = []
+        for name, values in sections:
+            offset += -offset % 8 # Align every section on 8 bytes.
+            table.append((name, values, offset))
+            offset += values.itemsize * len(values)
+        byteorder = b"<" if sys.byteorder == "little" else b">"
+        with open(path, "wb") as out:
+            out.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, byteorder, len(sections)))
+            for name, values, offset in table:
+                out.write(SECTION.pack(name.encode("ascii"), values.typecode.encode("ascii"),
+                                       offset, len(values)))
+            for name, values, offset in table:
+                out.write(b"\0" * (offset - out.tell()))
+                values.tofile(out)
+
+class MappedVocabulary(object):
+    """The vocabulary of a MappedReferenceStore.  Words are stored as UTF-32
+    code points and decoded when they are read."""
+    def __init__(self, buf, base, word_offsets):
+        self.buf = buf
+        self.base = base
+        self.word_offsets = word_offsets
+
+    def __len__(self):
+        return len(self.word_offsets) - 1
+
+    def __getitem__(self, word_id):
+        start = self.base + 4 * self.word_offsets[word_id]
+        end = self.base + 4 * self.word_offsets[word_id + 1]
+        return self.buf[start:end].decode("utf-32-le")
+
+    def __iter__(self):
+        for word_id in range(len(self)):
+            yield self[word_id]
+
+class MappedWordIds(object):
+    """Look up word ids in a MappedReferenceStore by binary search over the
+    sorted vocabulary."""
+    def __init__(self, words, sorted_words):
+        self.words = words
+        self.sorted_words = sorted_words
+
+    def get(self, word, default=None):
+        if not isinstance(word, type(u"")):
+            word = word.decode("utf-8")
+        words, sorted_words = self.words, self.sorted_words
+        lo, hi = 0, len(sorted_words)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if words[sorted_words[mid]] < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(sorted_words) and words[sorted_words[lo]] == word:
+            return sorted_words[lo]
+        return default
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+class MappedReferenceStore(ReferenceStore):
+    """A read-only ReferenceStore backed by a memory-mapped file written by
+    ReferenceStore.save().
+
+    The arrays are views of the mapped file rather than copies (on Python 2
+    this requires NumPy), so processes that map the same file share a single
+    copy of the reference data through the operating system's page cache.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as data_file:
+            self.mm = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, byteorder, count = HEADER.unpack_from(self.mm, 0)
+        if magic != STORE_MAGIC:
+            raise ValueError("%s is not a reference store file" % path)
+        if version != STORE_VERSION:
+            raise ValueError("%s has store version %d, expected %d" % (path, version, STORE_VERSION))
+        if byteorder != (b"<" if sys.byteorder == "little" else b">"):
+            raise ValueError("%s was written on a machine with a different byte order" % path)
+        self.duplicates = 0
+        self.conflicts = []
+        self.offsets = {}
+        if not self.shares_memory():
+            warnings.warn("NumPy is not installed: the arrays of %s are copied into private memory "
+                          "instead of being shared with the other processes that map it" % path,
+                          RuntimeWarning, stacklevel=2)
+        for idx in range(count):
+            name, typecode, offset, length = SECTION.unpack_from(self.mm, HEADER.size + idx * SECTION.size)
+            name = name.rstrip(b"\0").decode("ascii")
+            self.offsets[name] = offset
+            setattr(self, name, self.section(typecode.decode("ascii"), offset, length))
+        self.words = MappedVocabulary(self.mm, self.offsets["vocabulary"], self.word_offsets)
+        self.word_ids = MappedWordIds(self.words, self.sorted_words)
+
+    def __getstate__(self):
+        # A mapped store is pickled by reference to its file.
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    @staticmethod
+    def shares_memory():
+        """Whether the arrays can be views of the mapped file: always on Python 3,
+        and on Python 2 only with NumPy."""
+        if sys.version_info[0] >= 3:
+            return True
+        try:
+            import numpy
+        except ImportError:
+            return False
+        return True
+
+    def section(self, typecode, offset, length):
+        end = offset + array(typecode).itemsize * length
+        if sys.version_info[0] >= 3:
+            return memoryview(self.mm)[offset:end].cast(typecode)
+        try:
+            import numpy
+        except ImportError:
+            return array(typecode, self.mm[offset:end]) # A private copy.
+        return numpy.frombuffer(self.mm, numpy.dtype(typecode), length, offset)
+
+    def word_id(self, word):
+        raise ValueError("reference store %s is read-only" % self.path)
+
+    def label_id(self, label_words):
+        raise ValueError("reference store %s is read-only" % self.path)
+
+    def add_phrase(self, phrase_words, label_words):
+        raise ValueError("reference store %s is read-only" % self.path)
@@ -0,0 +1,25 @@
+import io
+import json
+
+def read_inputs(path):
+    """Read test inputs from a file, returning a list of word lists.
+
+    Lines that hold a JSON object, like the sample files in samples/, give
+    one input for each value that is a list of words (or a string); other
+    lines are split on white space.  Blank lines are skipped.  Files are read
+    as UTF-8 text.
+
+    """
+    inputs = []
+    with io.open(path, encoding="utf-8") as input_file:
+        for line in input_file:
+            line = line.strip()
+            if line.startswith("{"):
+                for value in json.loads(line).values():
+                    if isinstance(value, list) and value:
+                        inputs.append([word for word in value])
+                    elif value and not isinstance(value, (dict, list)):
+                        inputs.append(("%s" % value).split())
+            elif line:
+                inputs.append(line.split())
+    return inputs
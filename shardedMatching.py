@@ -0,0 +1,271 @@
+"""Scatter-gather matching over reference phrases split across processes.
+
+The reference phrases are split into contiguous partitions (shards), each
+served by a worker process that may run on another host.  A coordinator
+sends every batch of inputs to all the workers, which match it against
+their own phrases, and merges the replies: the highest score wins, and
+ties go to the phrase with the lowest index in the full reference list.
+Because the partitions are contiguous and each worker reports the first
+of its equally good phrases, this is the phrase the sequential scan of
+HybridJaccard.findBestMatchWords() would choose.
+
+Workers and coordinator talk through multiprocessing.connection, so the
+same code runs with local processes standing in for remote nodes (see
+start_local_shards()).  In approximate mode each worker shortlists the
+phrases of its own shard, so the results may differ from a single process.
+
+Connections carry pickled objects, and unpickling can run arbitrary code,
+so a worker only accepts coordinators that know its secret key, and must
+only listen on a private network.  There is no default key: it is given
+with --authkey or in the HYBRID_JACCARD_AUTHKEY environment variable.
+
+"""
+import argparse
+import json
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+import os
+import sys
+import time
+import hybridJaccard as hj
+import sampleInputs
+
+AUTHKEY_VARIABLE = "HYBRID_JACCARD_AUTHKEY"
+
+def shard_range(count, shard, shards):
+    """Return the (start, end) phrase indexes of partition 'shard' of 'shards'
+    when 'count' phrases are split into contiguous partitions of nearly equal
+    size."""
+    return count * shard // shards, count * (shard + 1) // shards
+
+def build_shard(sm, shard, shards):
+    """Return a copy of the HybridJaccard instance sm holding only partition
+    'shard' of 'shards' of its reference phrases, and the index of the first
+    phrase of the partition."""
+    start, end = shard_range(len(sm.store), shard, shards)
+    state = sm.__getstate__()
+    state["store"] = sm.store.partition(start, end)
+    state["cache"] = []
+    state["vocabulary_index"] = None
+    state["ngram_index"] = None
+    state["phonetic_index"] = None
+    state["exact_index"] = None
+    shard_sm = hj.HybridJaccard.__new__(hj.HybridJaccard)
+    shard_sm.__setstate__(state)
+    return shard_sm, start
+
+def match_shard(sm, start, input_word_lists):
+    """Match a batch of inputs against one shard.  Returns one (score, phrase
+    index, label) tuple per input, where the phrase index counts from the
+    start of the full reference list, and the label is a list of words, or
+    None if no phrase of the shard reaches min_score."""
+    results = []
+    for input_words in input_word_lists:
+        max_sim, max_sim_index = sm.best_match(input_words)
+        if not sm.is_match(max_sim):
+            results.append((max_sim, start + max_sim_index, None))
+        else:
+            results.append((max_sim, start + max_sim_index, sm.store.phrase_label(max_sim_index)))
+    return results
+
+def serve_shard(sm, start, address, authkey, ready=None):
+    """Serve one shard at 'address' (a (host, port) pair) until a coordinator
+    sends "stop".  Only coordinators using the same 'authkey' (bytes) are
+    accepted, and they are served one connection at a time.  If 'ready' is
+    a connection, the address actually listened on (useful with port 0) is
+    sent to it."""
+    if not authkey:
+        raise ValueError("a shard worker needs an authentication key")
+    listener = Listener(address, authkey=authkey)
+    if ready is not None:
+        ready.send(listener.address)
+        ready.close()
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (multiprocessing.AuthenticationError, EOFError, IOError):
+                continue # a peer without the key, or one that hung up
+            try:
+                while True:
+                    try:
+                        request = connection.recv()
+                    except EOFError:
+                        break
+                    if request[0] == "match":
+                        connection.send(match_shard(sm, start, request[1]))
+                    elif request[0] == "stop":
+                        return
+                    else:
+                        raise ValueError("unknown shard request %r" % (request[0],))
+            finally:
+                connection.close()
+    finally:
+        listener.close()
+
+def merge_results(replies):
+    """Merge the replies of all shards to one batch, returning one label (a list
+    of words, or None) per input."""
+    results = []
+    for shard_results in zip(*replies):
+        best = None
+        for score, idx, label in shard_results:
+            if label is not None and (best is None or score > best[0] or
+                                      (score == best[0] and idx < best[1])):
+                best = (score, idx, label)
+        results.append(best[2] if best is not None else None)
+    return results
+
+class ShardCoordinator(object):
+    """Scatters batches of inputs to the shard workers and gathers the results."""
+
+    def __init__(self, addresses, authkey):
+        if not authkey:
+            raise ValueError("connecting to shard workers needs their authentication key")
+        self.connections = [Client(address, authkey=authkey) for address in addresses]
+
+    def findBestMatchWordsBatch(self, input_word_lists):
+        """Find the best match for each of a list of word lists, as
+        findBestMatchWords() would with all the shards' phrases in one
+        instance.  Returns a list of labels (lists of words, or None)."""
+        input_word_lists = list(input_word_lists)
+        for connection in self.connections:
+            connection.send(("match", input_word_lists))
+        # Every worker has the batch before the first reply is awaited, so the
+        # shards are matched in parallel.
+        return merge_results([connection.recv() for connection in self.connections])
+
+    def findBestMatchWords(self, input_words):
+        return self.findBestMatchWordsBatch([input_words])[0]
+
+    def close(self, stop_workers=False):
+        """Close the connections, first telling the workers to exit if
+        stop_workers is set."""
+        for connection in self.connections:
+            if stop_workers:
+                connection.send(("stop",))
+            connection.close()
+        self.connections = []
+
+def start_local_shards(sm, shards, authkey, host="127.0.0.1"):
+    """Start one local worker process per shard of sm's references, each
+    listening on a free port.  Returns the processes and their addresses."""
+    processes = []
+    addresses = []
+    for shard in range(shards):
+        shard_sm, start = build_shard(sm, shard, shards)
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=serve_shard,
+                                          args=(shard_sm, start, (host, 0), authkey, sender))
+        process.daemon = True
+        process.start()
+        sender.close()
+        addresses.append(receiver.recv())
+        receiver.close()
+        processes.append(process)
+    return processes, addresses
+
+def store_matcher(store_path, config_path, method_type):
+    """Return a HybridJaccard instance over a compiled reference store, with the
+    settings of a configuration file.  Its references, if it lists any, are
+    skipped: they are the ones compiled into the store."""
+    sm = hj.HybridJaccard(method_type=method_type, store_path=store_path)
+    if config_path:
+        with open(config_path, 'r') as config_file:
+            data = json.load(config_file)
+        section = data.get(method_type) or {}
+        section.pop("references", None)
+        section.pop("references_files", None)
+        sm.build_configuration(data)
+    return sm
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def main():
+    "Command line interface: serve a shard, or match inputs against sharded references."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-s','--storeFile', help="Compiled reference store (see compileReferences.py).", required=False)
+    parser.add_argument('-a','--authkey', help="Secret key shared by the workers and the coordinator "
+                        "(default: the %s environment variable)." % AUTHKEY_VARIABLE, required=False)
+    parser.add_argument('--serve', help="Serve one shard at host:port.", required=False)
+    parser.add_argument('--shard', help="Shard to serve (0-based).", type=int, default=0)
+    parser.add_argument('--shards', help="Number of shards.", type=int, default=1)
+    parser.add_argument('-w','--workers', help="Comma-separated host:port addresses of shard workers.", required=False)
+    parser.add_argument('-l','--local', help="Start this many local shard workers.", type=int, default=0)
+    parser.add_argument('-i','--input', help="Input file of phrases (text or JSON lines) to match.", required=False)
+    parser.add_argument('-b','--batchSize', help="Inputs per request to the workers.", type=int, default=256)
+    parser.add_argument('--verify', help="Compare with a single process (requires the references).", action='store_true')
+    args = parser.parse_args()
+    has_references = bool(args.configFile or args.referenceFile or args.storeFile)
+    if args.serve or args.workers:
+        authkey = args.authkey or os.environ.get(AUTHKEY_VARIABLE)
+        if not authkey:
+            parser.error("workers need a secret key: use --authkey or set %s" % AUTHKEY_VARIABLE)
+        authkey = authkey.encode("utf-8")
+    else:
+        # Local workers only talk to this process; a random key will do.
+        authkey = os.urandom(32)
+    if args.storeFile and args.referenceFile:
+        parser.error("-r cannot be used with -s: the references are compiled into the store")
+    if args.serve and not args.storeFile:
+        # Only the pages of the mapped store that the shard reads are loaded,
+        # so the worker does not hold the whole reference data.
+        parser.error("--serve needs a compiled reference store (-s, see compileReferences.py)")
+    if not args.serve:
+        if not args.workers and not args.local:
+            parser.error("give the shard workers with -w, or start local ones with -l")
+        if args.local and not has_references:
+            parser.error("-l needs the references (-c, -r or -s)")
+        if args.verify and not has_references:
+            parser.error("--verify needs the references (-c, -r or -s)")
+        if not args.input:
+            parser.error("the inputs to match are required (-i)")
+
+    sm = None
+    if args.storeFile:
+        sm = store_matcher(args.storeFile, args.configFile, args.methodType)
+    elif has_references:
+        sm = hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                              method_type=args.methodType)
+    if args.serve:
+        shard_sm, start = build_shard(sm, args.shard, args.shards)
+        sm = None
+        print("serving phrases %d to %d at %s" % (start, start + len(shard_sm.store) - 1, args.serve))
+        serve_shard(shard_sm, start, parse_address(args.serve), authkey)
+        return
+
+    processes = []
+    if args.local:
+        processes, addresses = start_local_shards(sm, args.local, authkey)
+    else:
+        addresses = [parse_address(address) for address in args.workers.split(",")]
+    coordinator = ShardCoordinator(addresses, authkey)
+    try:
+        inputs = sampleInputs.read_inputs(args.input)
+        start = time.time()
+        results = []
+        for idx in range(0, len(inputs), args.batchSize):
+            results.extend(coordinator.findBestMatchWordsBatch(inputs[idx:idx + args.batchSize]))
+        seconds = time.time() - start
+        if args.verify:
+            differences = sum(1 for input_words, result in zip(inputs, results)
+                              if sm.findBestMatchWords(input_words) != result)
+            print("%d inputs, %d shards, %.3fs, %d results differ from a single process" %
+                  (len(inputs), len(addresses), seconds, differences))
+        else:
+            for input_words, result in zip(inputs, results):
+                print(" ".join(input_words) + " => " + (" ".join(result) if result else "NONE"))
+    finally:
+        coordinator.close(stop_workers=bool(processes))
+        for process in processes:
+            process.join()
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
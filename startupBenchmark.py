@@ -0,0 +1,57 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that importing hybridJaccard should not load; they are imported on
+# first use.
+LAZY_MODULES = ["numpy", "Levenshtein", "pickle", "cPickle", "hashlib", "asyncio"]
+
+def startup_command(statement):
+    """Return a program that runs 'statement' and prints the seconds it took
+    and the LAZY_MODULES it loaded."""
+    return ("import sys, time\n"
+            "start = time.time()\n"
+            "%s\n"
+            "seconds = time.time() - start\n"
+            "print(seconds)\n"
+            "print(' '.join(name for name in %r if name in sys.modules))\n" % (statement, LAZY_MODULES))
+
+def measure(statement, runs):
+    """Run 'statement' in 'runs' fresh interpreters.  Returns the sorted run
+    times in seconds and the lazy modules loaded by the last run."""
+    times = []
+    loaded = ""
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", startup_command(statement)],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        lines = output.decode("utf-8").split("\n")
+        times.append(float(lines[0]))
+        loaded = lines[1].strip()
+    times.sort()
+    return times, loaded
+
+def main():
+    "Command line interface: measure how long a fresh interpreter takes to import and set up HybridJaccard."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-s','--storeFile', help="Compiled reference store (see compileReferences.py).", required=False)
+    parser.add_argument('-n','--runs', help="Number of runs of each measurement.", type=int, default=10)
+    args = parser.parse_args()
+
+    statements = [("import", "import hybridJaccard")]
+    if args.configFile or args.referenceFile or args.storeFile:
+        statements.append(("import and build", "import hybridJaccard\n"
+                           "sm = hybridJaccard.HybridJaccard(ref_path=%r, config_path=%r, method_type=%r, store_path=%r)" %
+                           (args.referenceFile, args.configFile, args.methodType, args.storeFile)))
+    for name, statement in statements:
+        times, loaded = measure(statement, args.runs)
+        print("%s: median %.1fms, best %.1fms over %d runs; lazy modules loaded: %s" %
+              (name, times[len(times) // 2] * 1000, times[0] * 1000, len(times), loaded or "none"))
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
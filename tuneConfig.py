@@ -0,0 +1,121 @@
+"""Pick the fastest exact engine settings for one configuration section.
+
+The settings that change only the speed of matching -- the assignment
+method, the vocabulary and exact indexes, the row cache size and the pair cache budget
+-- are tried one parameter at a time on a sample of inputs, keeping the
+other parameters at their best values so far.  A setting is only accepted
+if every input gets the same match as with the section's current settings.
+The winning values are written to the section's "parameters", where
+HybridJaccard picks them up when it is created.
+
+"""
+import argparse
+import collections
+import io
+import json
+import sys
+import time
+import assignment
+import hybridJaccard as hj
+import sampleInputs
+
+# The value HybridJaccard uses for each tuned parameter that is not set.
+DEFAULTS = {"assignment": "optimal", "vocabulary_index": "true", "exact_index": "true",
+            "row_cache_size": "1024", "pair_cache_mb": "0"}
+
+# A setting must be at least this much faster than the best so far to be
+# accepted, so that timing noise does not decide.
+MIN_GAIN = 0.05
+
+def candidate_settings():
+    """Return the values to try for each tuned parameter, as (name, values)
+    pairs in the order they are tuned.  Only exact settings are tried; the
+    "greedy" assignment and the approximate mode can change the results."""
+    methods = ["optimal", "auto"]
+    if assignment.numpy_module() is not None:
+        methods.insert(1, "vectorized")
+    return [("assignment", methods),
+            ("vocabulary_index", ["true", "false"]),
+            ("exact_index", ["true", "false"]),
+            ("row_cache_size", ["0", "1024", "16384"]),
+            ("pair_cache_mb", ["0", "64"])]
+
+def build_matcher(data, method_type, parameters, ref_path=None, store_path=None):
+    """Create a HybridJaccard instance from the configuration 'data', with the
+    section's parameters replaced by 'parameters'."""
+    data = json.loads(json.dumps(data))
+    data[method_type]["parameters"] = dict(parameters)
+    sm = hj.HybridJaccard(ref_path=ref_path, method_type=method_type, store_path=store_path)
+    sm.build_configuration(data)
+    if sm.pair_cache is not None:
+        # Shared with earlier candidates; start cold like a new process.
+        sm.pair_cache.clear()
+    return sm
+
+def measure(data, method_type, parameters, inputs, runs, ref_path=None, store_path=None):
+    """Match the inputs with fresh instances using 'parameters'.  Returns the
+    shortest of 'runs' match times and the results of the last run."""
+    best = None
+    for _ in range(runs):
+        sm = build_matcher(data, method_type, parameters, ref_path, store_path)
+        start = time.time()
+        results = [sm.findBestMatchWords(input_words) for input_words in inputs]
+        seconds = time.time() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best, results
+
+def tune(data, method_type, inputs, runs=3, ref_path=None, store_path=None):
+    """Return the fastest parameters that give the same matches as the
+    section's current parameters, with a log of (parameters, seconds, same
+    results) for every setting tried."""
+    parameters = dict(data[method_type].get("parameters") or {})
+    best_time, expected = measure(data, method_type, parameters, inputs, runs, ref_path, store_path)
+    log = [(dict(parameters), best_time, True)]
+    for name, values in candidate_settings():
+        for value in values:
+            if parameters.get(name, DEFAULTS[name]) == value:
+                continue
+            trial = dict(parameters)
+            trial[name] = value
+            seconds, results = measure(data, method_type, trial, inputs, runs, ref_path, store_path)
+            accepted = results == expected and seconds < best_time * (1.0 - MIN_GAIN)
+            log.append((trial, seconds, results == expected))
+            if accepted:
+                parameters, best_time = trial, seconds
+    return parameters, log
+
+def main():
+    "Command line interface: tune the parameters of a configuration section on a sample of inputs."
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=True)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to tune.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-s','--storeFile', help="Compiled reference store (see compileReferences.py).", required=False)
+    parser.add_argument('-i','--input', help="Sample of inputs (text or JSON lines).", required=True)
+    parser.add_argument('-n','--runs', help="Runs of each setting; the fastest counts.", type=int, default=3)
+    parser.add_argument('-o','--output', help="Configuration file to write (default: the input file).", required=False)
+    parser.add_argument('--dryRun', help="Report the results without writing the configuration.", action='store_true')
+    args = parser.parse_args()
+
+    with io.open(args.configFile, encoding="utf-8") as config_file:
+        data = json.load(config_file, object_pairs_hook=collections.OrderedDict)
+    inputs = sampleInputs.read_inputs(args.input)
+    parameters, log = tune(data, args.methodType, inputs, args.runs, args.referenceFile, args.storeFile)
+    for trial, seconds, same in log:
+        print("%.3fs %s%s" % (seconds, json.dumps(trial, sort_keys=True), "" if same else " (different results)"))
+    print("best: %s" % json.dumps(parameters, sort_keys=True))
+    if not args.dryRun:
+        section = data[args.methodType]
+        section_parameters = section.get("parameters")
+        if section_parameters is None:
+            section_parameters = section["parameters"] = collections.OrderedDict()
+        for name in sorted(parameters):
+            section_parameters[name] = parameters[name]
+        with io.open(args.output or args.configFile, "w", encoding="utf-8") as config_file:
+            config_file.write(json.dumps(data, indent=2, separators=(",", ": "), ensure_ascii=False) + u"\n")
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+from array import array
+
+# Allowance for rounding in the similarity metrics, so that the pre-filter
+# never rejects a word the metric itself would accept.
+EPSILON = 1e-9
+
+def char_bit(char):
+    """Map a character to one bit of a 32-bit signature.  Each lower case ASCII
+    letter has a bit of its own; all other characters share the top six bits.
+
+    """
+    code = ord(char)
+    if 97 <= code <= 122:
+        return 1 << (code - 97)
+    return 1 << (26 + code % 6)
+
+def word_mask(word):
+    """Return the character-set signature of a word."""
+    mask = 0
+    for char in word:
+        mask |= char_bit(char)
+    return mask
+
+def upper_bound(matches, len1, len2, method):
+    """Return an upper bound for the similarity of two words of lengths len1 and
+    len2 that have at most 'matches' characters in common.
+
+    Jaro-Winkler: the Jaro weight is at most (m/len1 + m/len2 + 1)/3, and the
+    Winkler boost can add at most 0.1 per common prefix character (up to 4)
+    of the remaining distance.
+
+    Levenshtein (as computed by HybridJaccard.levenshtein_sim): the edit
+    distance is at least max_len - m, so the similarity is at most m/min_len.
+
+    """
+    if matches == 0:
+        return 0.0
+    if method == "jaro":
+        weight = (float(matches) / len1 + float(matches) / len2 + 1.0) / 3.0
+        return weight + min(4, len1, len2) * 0.1 * (1.0 - weight)
+    return float(matches) / min(len1, len2)
+
+class VocabularyIndex(object):
+    """An index of the reference vocabulary by word length and character-set
+    signature.
+
+    candidates() returns the ids of the reference words that can reach a
+    similarity threshold with a given input word.  The test is exact: any word
+    left out is certain to score below the threshold.
+
+    """
+    def __init__(self, masks, by_length, length_of):
+        """'masks' holds the signature of each word, 'by_length' the word ids in
+        order of increasing length, and length_of(word_id) gives a word's
+        length."""
+        self.size = len(masks)
+        self.masks = masks
+        self.by_length = by_length
+        self.buckets = [] # (length, start, end) slices of by_length
+        start = 0
+        while start < len(by_length):
+            length = length_of(by_length[start])
+            end = start + 1
+            while end < len(by_length) and length_of(by_length[end]) == length:
+                end += 1
+            self.buckets.append((length, start, end))
+            start = end
+
+    @classmethod
+    def build(cls, words):
+        lengths = [len(word) for word in words]
+        masks = array('I', (word_mask(word) for word in words))
+        by_length = array('i', sorted(range(len(words)), key=lengths.__getitem__))
+        return cls(masks, by_length, lengths.__getitem__)
+
+    @classmethod
+    def from_store(cls, store):
+        """Use the signatures saved in a mapped store if there are any."""
+        word_masks = getattr(store, "word_masks", None)
+        if word_masks is None:
+            return cls.build(store.words)
+        offsets = store.word_offsets
+        return cls(word_masks, store.words_by_length,
+                   lambda word_id: offsets[word_id + 1] - offsets[word_id])
+
+    def candidates(self, word, method, threshold):
+        """Return the ids of the reference words that may have a similarity of at
+        least 'threshold' with 'word' under the given metric method."""
+        threshold -= EPSILON
+        in_len = len(word)
+        bit_counts = {}
+        for char in word:
+            bit = char_bit(char)
+            bit_counts[bit] = bit_counts.get(bit, 0) + 1
+        in_mask = 0
+        for bit in bit_counts:
+            in_mask |= bit
+        bit_counts = list(bit_counts.items())
+        masks = self.masks
+        by_length = self.by_length
+        result = []
+        for length, start, end in self.buckets:
+            max_matches = min(in_len, length)
+            if upper_bound(max_matches, in_len, length, method) < threshold:
+                continue
+            for idx in range(start, end):
+                word_id = by_length[idx]
+                shared = masks[word_id] & in_mask
+                # Only input characters whose bit the reference word shares
+                # can be matched.
+                matches = 0
+                for bit, count in bit_counts:
+                    if shared & bit:
+                        matches += count
+                if upper_bound(min(matches, max_matches), in_len, length, method) >= threshold:
+                    result.append(word_id)
+        return result
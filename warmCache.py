@@ -0,0 +1,95 @@
+import argparse
+import io
+import multiprocessing
+import sys
+import hybridJaccard as hj
+import sampleInputs
+
+matcher = None # the HybridJaccard object of a worker process
+
+def init_worker(sm):
+    global matcher
+    matcher = sm
+
+def match_batch(input_strs):
+    return matcher.findBestLabelIds([input_str.split() for input_str in input_strs])
+
+def count_inputs(paths):
+    """Count the distinct inputs in sample files, returning (count, input string)
+    pairs, most frequent first."""
+    counts = {}
+    for path in paths:
+        for input_words in sampleInputs.read_inputs(path):
+            input_str = " ".join(input_words)
+            counts[input_str] = counts.get(input_str, 0) + 1
+    return sorted(((count, input_str) for input_str, count in counts.items()),
+                  key=lambda item: (-item[0], item[1]))
+
+def read_frequencies(path, top):
+    """Read the 'count<TAB>input' lines of a frequency file, keeping the first top."""
+    input_strs = []
+    with io.open(path, encoding="utf-8") as frequency_file:
+        for line in frequency_file:
+            _, _, input_str = line.rstrip("\n").partition("\t")
+            input_strs.append(input_str)
+            if len(input_strs) == top:
+                break
+    return input_strs
+
+def warm(sm, input_strs, processes=1, batch_size=100):
+    """Match the input strings, in parallel if processes > 1, and store the
+    results in the cache of sm."""
+    batches = [input_strs[idx:idx + batch_size] for idx in range(0, len(input_strs), batch_size)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, init_worker, (sm,))
+        try:
+            results = pool.map(match_batch, batches)
+        finally:
+            pool.close()
+            pool.join()
+        for batch, label_ids in zip(batches, results):
+            for input_str, label_id in zip(batch, label_ids):
+                sm.cache[sm.cache_key(input_str.split())] = label_id
+    else:
+        for batch in batches:
+            sm.findBestMatchStringsCached(batch)
+
+def main():
+    """Command line interface: build a frequency file from sample inputs, and/or
+    match the most frequent inputs and write a warm cache file that can be
+    named as "cache_file" in the configuration."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c','--configFile', help="Configuration file (JSON).", required=False)
+    parser.add_argument('-m','--methodType', help="Section of the configuration file to use.", default="method_type")
+    parser.add_argument('-r','--referenceFile', help="Reference file.", required=False)
+    parser.add_argument('-s','--samples', help="Sample input files (text or JSON lines).", nargs='*', default=[])
+    parser.add_argument('-f','--frequencies', help="Frequency file (count<TAB>input), read or written.", required=False)
+    parser.add_argument('-n','--top', help="Number of most frequent inputs to match.", type=int, default=10000)
+    parser.add_argument('-p','--processes', help="Number of worker processes.", type=int, default=1)
+    parser.add_argument('-o','--output', help="Warm cache file to write.", required=False)
+    args = parser.parse_args()
+
+    if args.samples:
+        ranked = count_inputs(args.samples)
+        if args.frequencies:
+            with io.open(args.frequencies, 'w', encoding="utf-8") as frequency_file:
+                for count, input_str in ranked:
+                    frequency_file.write(u"%d\t%s\n" % (count, input_str))
+            print("%d distinct inputs => %s" % (len(ranked), args.frequencies))
+        input_strs = [input_str for _, input_str in ranked[:args.top]]
+    elif args.frequencies:
+        input_strs = read_frequencies(args.frequencies, args.top)
+    else:
+        parser.error("give sample files (-s) or a frequency file (-f)")
+
+    if args.output:
+        sm = hj.HybridJaccard(ref_path=args.referenceFile, config_path=args.configFile,
+                              method_type=args.methodType)
+        warm(sm, input_strs, args.processes)
+        sm.save_cache(args.output)
+        print("%d cached results => %s" % (len(sm.cache), args.output))
+
+# call main() if this is run as standalone
+if __name__ == "__main__":
+    sys.exit(main())